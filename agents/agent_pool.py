@@ -0,0 +1,42 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from agents.booking_agent import create_booking_agent
+from agents.budget_estimator import create_budget_estimator
+from agents.destination_researcher import create_destination_researcher
+from agents.itinerary_planner import create_itinerary_planner
+
+# Agent factories keyed by the role each agent is created with
+AGENT_FACTORIES = {
+    "Destination Research Specialist": create_destination_researcher,
+    "Flight Booking Specialist": create_booking_agent,
+    "Travel Itinerary Planner": create_itinerary_planner,
+    "Travel Budget Analyst": create_budget_estimator,
+}
+
+# Agents print their reasoning to stdout only when asked to; structured metrics
+# come through the plan events instead
+CREW_VERBOSE = os.getenv("CREW_VERBOSE", "false").lower() in ("1", "true", "yes", "on")
+
+_lock = threading.Lock()
+_idle_agents = {}
+
+
+@contextmanager
+def checkout_agent(role: str, llm=None):
+    """Borrow an agent for `role` from the process-wide pool, creating one if none is idle.
+    A crew attaches itself to its agents, so each agent is used by one crew at a time
+    and goes back to the pool when the block exits.
+    """
+    key = (role, id(llm))
+    with _lock:
+        idle = _idle_agents.setdefault(key, [])
+        agent = idle.pop() if idle else None
+    if agent is None:
+        agent = AGENT_FACTORIES[role](llm, verbose=CREW_VERBOSE)
+    try:
+        yield agent
+    finally:
+        with _lock:
+            _idle_agents[key].append(agent)
@@ -1,6 +1,6 @@
 from crewai import Agent
 
-def create_booking_agent(llm=None):
+def create_booking_agent(llm=None, verbose=True):
     """Creates a flight booking research agent"""
     agent_config = {
         'role': 'Flight Booking Specialist',
@@ -8,7 +8,7 @@ def create_booking_agent(llm=None):
         'backstory': """You are an expert flight booking agent with extensive knowledge of 
         flight routes, airlines, and booking strategies. You provide recommendations on 
         flight options, timing, and booking advice for the best travel experience.""",
-        'verbose': True,
+        'verbose': verbose,
         'allow_delegation': False
     }
     
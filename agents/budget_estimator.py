@@ -1,6 +1,6 @@
 from crewai import Agent
 
-def create_budget_estimator(llm=None):
+def create_budget_estimator(llm=None, verbose=True):
     """Creates a budget estimation agent"""
     agent_config = {
         'role': 'Travel Budget Analyst',
@@ -9,7 +9,7 @@ def create_budget_estimator(llm=None):
         travel costs worldwide. You provide detailed breakdowns of expenses including 
         flights, accommodation, food, activities, and transportation. You're skilled at 
         finding ways to optimize budgets while maintaining quality experiences.""",
-        'verbose': True,
+        'verbose': verbose,
         'allow_delegation': False
     }
     
@@ -1,6 +1,6 @@
 from crewai import Agent
 
-def create_destination_researcher(llm=None):
+def create_destination_researcher(llm=None, verbose=True):
     """Creates a destination research agent"""
     agent_config = {
         'role': 'Destination Research Specialist',
@@ -9,7 +9,7 @@ def create_destination_researcher(llm=None):
         destinations worldwide. You excel at finding the best attractions, hidden gems, 
         cultural experiences, and activities that match travelers' preferences. You have 
         deep knowledge of tourist attractions, cultural sites, restaurants, and local experiences.""",
-        'verbose': True,
+        'verbose': verbose,
         'allow_delegation': False
     }
     
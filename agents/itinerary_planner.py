@@ -1,6 +1,6 @@
 from crewai import Agent
 
-def create_itinerary_planner(llm=None):
+def create_itinerary_planner(llm=None, verbose=True):
     """Creates an itinerary planning agent"""
     agent_config = {
         'role': 'Travel Itinerary Planner',
@@ -9,7 +9,7 @@ def create_itinerary_planner(llm=None):
         crafting perfect daily schedules for travelers. You know how to balance sightseeing, 
         rest, meals, and travel time. You consider factors like opening hours, travel distances, 
         and energy levels to create realistic and enjoyable itineraries.""",
-        'verbose': True,
+        'verbose': verbose,
         'allow_delegation': False
     }
     
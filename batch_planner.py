@@ -0,0 +1,158 @@
+"""
+Bulk/offline trip planning.
+Reads trip specs from a JSONL or CSV file and runs plan_trip_with_crew_stream for each row on a
+worker pool. Results are appended to <out>/results.jsonl as rows finish and each plan's PDF is
+streamed to <out>/pdfs/<id>.pdf. Rows already recorded as successful are skipped, so an
+interrupted run can simply be restarted.
+
+Each row needs origin and destination; days, budget, preferences, people and id are optional.
+An id names the row's PDF, so it must be unique, start with a letter or digit and use only letters,
+digits, '.', '_' and '-'.
+"""
+import csv
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from crew_orchestrator import CREW_STEPS, plan_trip_with_crew_stream
+from utils.cache import make_cache_key
+from utils.export_utils import sections_from_events, stream_pdf
+from utils.rate_limit import TokenBucket
+
+SPEC_DEFAULTS = {"days": 5, "budget": "", "preferences": "", "people": 1}
+# Ids become file names under the PDF directory
+SAFE_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]{0,127}")
+
+
+def read_specs(path: str) -> Iterator[Dict]:
+    """Yield normalized trip specs from a .jsonl or .csv file. A row repeating an earlier one is
+    skipped; an id that is unsafe as a file name or reused for a different trip is an error."""
+    seen = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        if str(path).lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            spec = {**SPEC_DEFAULTS, **{k: v for k, v in row.items() if v not in (None, "")}}
+            spec["days"] = int(spec["days"])
+            spec["people"] = int(spec["people"])
+            if not spec.get("origin") or not spec.get("destination"):
+                raise ValueError(f"Trip spec needs origin and destination: {row}")
+            # Stable id so a restarted run recognizes finished rows
+            spec["id"] = str(spec.get("id") or make_cache_key(
+                spec["origin"], spec["destination"], spec["days"], spec["budget"], spec["preferences"], spec["people"]
+            )[:16])
+            if not SAFE_ID.fullmatch(spec["id"]):
+                raise ValueError(f"Trip spec id must start with a letter or digit and use only letters, digits, "
+                                 f"'.', '_' or '-': {spec['id']!r}")
+            if spec["id"] in seen:
+                # Two workers on one id would write the same PDF at once
+                if seen[spec["id"]] != spec:
+                    raise ValueError(f"Trip spec id {spec['id']!r} is used for different trips")
+                print(f"⚠️ Skipping duplicate trip {spec['id']}")
+                continue
+            seen[spec["id"]] = spec
+            yield spec
+
+
+def completed_ids(results_path: Path) -> set:
+    """Ids of rows that already finished successfully."""
+    done = set()
+    if results_path.exists():
+        with open(results_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # partial line from an interrupted write
+                if record.get("status") == "ok":
+                    done.add(record["id"])
+    return done
+
+
+def plan_to_pdf(spec: Dict, pdf_path: Path) -> str:
+    """Run one plan, streaming its sections into a PDF. Returns the combined plan text."""
+    final = {}
+
+    def capture(events):
+        for event in events:
+            if event["type"] == "final":
+                final["text"] = event["result"]
+            yield event
+
+    events = plan_trip_with_crew_stream(
+        origin=spec["origin"],
+        destination=spec["destination"],
+        days=spec["days"],
+        budget=spec["budget"],
+        preferences=spec["preferences"],
+        people=spec["people"],
+    )
+    titles = {step["step"]: step["title"] for step in CREW_STEPS}
+    partial = pdf_path.with_suffix(".pdf.part")
+    try:
+        with open(partial, "wb") as f:
+            stream_pdf(sections_from_events(capture(events), titles), f,
+                       title=f"Trip Plan: {spec['origin']} to {spec['destination']}")
+        os.replace(partial, pdf_path)
+    except BaseException:
+        # Don't leave a half-written file behind for a failed plan or render
+        partial.unlink(missing_ok=True)
+        raise
+    return final.get("text", "")
+
+
+def run_batch(specs_path: str, out_dir: str = "batch_output", workers: int = 4, per_minute: float = 0) -> Dict:
+    """Plan every spec in specs_path, skipping rows finished by an earlier run. Returns counts."""
+    out = Path(out_dir)
+    pdf_dir = out / "pdfs"
+    pdf_dir.mkdir(parents=True, exist_ok=True)
+    results_path = out / "results.jsonl"
+
+    done = completed_ids(results_path)
+    todo: List[Dict] = [spec for spec in read_specs(specs_path) if spec["id"] not in done]
+    print(f"📋 {len(todo)} trip(s) to plan, {len(done)} already done")
+
+    # Plan starts are paced by a token bucket; individual LLM calls are limited per provider
+    limiter = TokenBucket(per_minute / 60.0, capacity=1) if per_minute else None
+    write_lock = threading.Lock()
+    counts = {"ok": 0, "error": 0, "skipped": len(done)}
+
+    def work(spec):
+        if limiter:
+            limiter.acquire()
+        started = time.time()
+        pdf_path = pdf_dir / f"{spec['id']}.pdf"
+        record = {"id": spec["id"], "spec": spec}
+        try:
+            record["result"] = plan_to_pdf(spec, pdf_path)
+            record["pdf"] = str(pdf_path)
+            record["status"] = "ok"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+        record["elapsed"] = round(time.time() - started, 2)
+        with write_lock:
+            with open(results_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            counts[record["status"]] += 1
+            mark = "✅" if record["status"] == "ok" else "❌"
+            print(f"{mark} {spec['id']} {spec['origin']} → {spec['destination']} ({record['elapsed']}s)")
+
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = [pool.submit(work, spec) for spec in todo]
+    try:
+        for future in futures:
+            future.result()
+    except KeyboardInterrupt:
+        # Drop the queued rows; the ones already running finish and are recorded, so a rerun resumes
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return counts
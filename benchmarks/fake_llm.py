@@ -0,0 +1,251 @@
+"""
+Local stand-in for the services the planner calls, for offline benchmarks.
+Serves an OpenAI-compatible /chat/completions endpoint (plain and SSE streaming) whose replies
+are deterministic for a given prompt, plus the OpenTripMap geoname and OpenSky arrivals
+endpoints used by utils.flight_search. Time to first token, token rate and a 429 rate are
+configurable, so runs are repeatable and independent of the real providers.
+
+Usage:
+    python -m benchmarks.fake_llm --port 8765 --latency 0.3 --tokens-per-sec 80
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_WORDS = (
+    "museum old town harbour market street food walking tour cathedral riverside park gallery "
+    "local cuisine viewpoint beach hike train station boutique hotel neighbourhood cafe sunset "
+    "castle square festival night market ferry island temple garden rooftop bar day trip"
+).split()
+_SECTIONS = ("Overview", "Highlights", "Getting Around", "Where to Stay", "Costs", "Tips")
+_PERIODS = ("Morning", "Afternoon", "Evening")
+
+
+def _rng(*parts) -> random.Random:
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def fake_completion(prompt: str, max_tokens: int = 600) -> str:
+    """Deterministic markdown reply of about max_tokens words, shaped like an agent answer
+    (headings, day-by-day lines, bullets with prices)."""
+    rng = _rng(prompt, max_tokens)
+    lines = []
+    used = 0
+    day = 1
+    while used < max_tokens:
+        roll = rng.random()
+        if roll < 0.12:
+            line = f"## {rng.choice(_SECTIONS)}"
+        elif roll < 0.3:
+            line = f"**Day {day}**"
+            day += 1
+        elif roll < 0.55:
+            words = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 10)))
+            line = f"- {rng.choice(_PERIODS)}: {words} (${rng.randint(5, 250)})"
+        else:
+            words = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(12, 30)))
+            line = words[0].upper() + words[1:] + "."
+        lines.append(line)
+        used += len(line.split())
+    return "\n".join(lines)
+
+
+def _prompt_text(messages) -> str:
+    parts = []
+    for message in messages or []:
+        content = message.get("content") if isinstance(message, dict) else message
+        if isinstance(content, list):
+            content = " ".join(str(part.get("text", "")) for part in content if isinstance(part, dict))
+        parts.append(str(content or ""))
+    return "\n".join(parts)
+
+
+class FakeLLMServer:
+    """Threaded HTTP server answering like OpenRouter/OpenTripMap/OpenSky.
+
+    latency: seconds before the first token; tokens_per_sec: streaming rate (0 = instant);
+    completion_tokens: reply length when the request sets no max_tokens; error_rate: share of
+    chat requests answered with 429 (Retry-After: 0).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2,
+                 tokens_per_sec: float = 100.0, completion_tokens: int = 600, error_rate: float = 0.0,
+                 seed: int = 0):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self._errors = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            return self.error_rate > 0 and self._errors.random() < self.error_rate
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this, keep-alive clients stall on
+            # Nagle + delayed ACK (~40 ms) for every response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload, status=200, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if url.path.endswith("/models"):
+                    self._send_json({"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+                elif url.path.endswith("/places/geoname"):
+                    rng = _rng("geoname", query.get("name", "").lower())
+                    self._send_json({"name": query.get("name"), "lat": rng.uniform(-60, 70), "lon": rng.uniform(-180, 180)})
+                elif url.path.endswith("/flights/arrival"):
+                    rng = _rng("arrivals", query.get("airport"))
+                    self._send_json([{"icao24": f"{i:06x}"} for i in range(rng.randint(0, 40))])
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send_json({"error": {"message": "invalid JSON"}}, status=400)
+                    return
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json({"error": {"message": "not found"}}, status=404)
+                    return
+                if server._should_fail():
+                    self._send_json({"error": {"message": "rate limited"}}, status=429, headers={"Retry-After": "0"})
+                    return
+
+                prompt = _prompt_text(request.get("messages"))
+                max_tokens = int(request.get("max_tokens") or server.completion_tokens)
+                tokens = fake_completion(prompt, max_tokens).split(" ")
+                tokens = [tokens[0]] + [" " + t for t in tokens[1:]]
+                usage = {
+                    "prompt_tokens": max(1, len(prompt) // 4),
+                    "completion_tokens": len(tokens),
+                    "total_tokens": max(1, len(prompt) // 4) + len(tokens),
+                }
+                model = request.get("model", "fake-model")
+                completion_id = "chatcmpl-" + hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+                time.sleep(server.latency)
+
+                if not request.get("stream"):
+                    if server.tokens_per_sec:
+                        time.sleep(len(tokens) / server.tokens_per_sec)
+                    self._send_json({
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "".join(tokens)}}],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def send(delta, finish_reason=None, extra=None):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                        **(extra or {}),
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                try:
+                    send({"role": "assistant", "content": ""})
+                    # Tokens are flushed in small groups so high rates don't cost one sleep per token
+                    group = max(1, int(server.tokens_per_sec * 0.02)) if server.tokens_per_sec else len(tokens)
+                    for i in range(0, len(tokens), group):
+                        send({"content": "".join(tokens[i:i + group])})
+                        if server.tokens_per_sec:
+                            time.sleep(len(tokens[i:i + group]) / server.tokens_per_sec)
+                    send({}, finish_reason="stop", extra={"usage": usage})
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token (default: 0.2)")
+    parser.add_argument("--tokens-per-sec", type=float, default=100.0, help="Streaming rate, 0 for instant (default: 100)")
+    parser.add_argument("--completion-tokens", type=int, default=600, help="Reply length in tokens (default: 600)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429 (default: 0)")
+    opts = parser.parse_args()
+
+    server = FakeLLMServer(opts.host, opts.port, opts.latency, opts.tokens_per_sec,
+                           opts.completion_tokens, opts.error_rate)
+    print(f"🧪 Fake LLM listening on {server.url} (set OPENROUTER_BASE_URL={server.url}/v1)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Offline benchmark suite.
+Starts the fake LLM server (benchmarks/fake_llm.py), points the app at it and at a throwaway
+cache directory, then times the hot paths at realistic scales:
+
+    plan          plan_trip_with_crew_stream, several plans in parallel
+    airport_code  get_airport_code over codes, city names and geocoded misses
+    nearest       nearest_airport over random coordinates
+    flights       search_flights over random airport pairs
+    pdf           generate_pdf_from_text over distinct plan-sized documents
+
+Each suite reports throughput, p50/p95/p99 latency and peak traced memory, and is compared
+with benchmarks/baseline.json. Baselines are machine-specific and not committed: record one with
+--save-baseline before changing code, then rerun to compare. Each suite's baseline keeps the run
+settings it was recorded with (scale, repeat, fake server), and a run with other settings is not
+compared against it.
+
+Usage:
+    python -m benchmarks.run [--suite NAME ...] [--scale 1.0] [--repeat 3] [--save-baseline] [--tolerance 0.25]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Sequence
+
+from benchmarks.fake_llm import FakeLLMServer, fake_completion
+
+BASELINE_FILE = Path(__file__).parent / "baseline.json"
+# Options that change what a suite measures; a baseline only compares with runs that share them
+SETTINGS = ("scale", "repeat", "latency", "tokens_per_sec", "completion_tokens")
+# Lower is better for these; throughput is higher-is-better
+_LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "peak_mem_mb")
+
+
+class Suite(NamedTuple):
+    name: str
+    setup: Callable[[float], Sequence]   # scale -> inputs
+    op: Callable                          # called once per input
+    concurrency: int = 1
+    reset: Callable = None                # drops memoized results so each pass starts cold
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def _configure_env(server_url: str, cache_dir: str):
+    """Point the app at the fake server before any app module reads its settings."""
+    os.environ.update({
+        "OPENROUTER_BASE_URL": f"{server_url}/v1",
+        "HF_ROUTER_BASE_URL": f"{server_url}/v1",
+        "OPENROUTER_API_KEY": "bench",
+        "OPENSKY_API_BASE": server_url,
+        "OPENTRIPMAP_API_BASE": server_url,
+        "OPENTRIPMAP_KEY": "bench",
+        "TRIP_PLANNER_CACHE_DIR": cache_dir,
+        # Every plan should reach the (fake) model; response caching is measured separately
+        "TRIP_PLANNER_CACHE": "off",
+        # Provider limits exist for real quotas; here they would only hide our own overhead
+        "OPENROUTER_RPS": os.getenv("BENCH_OPENROUTER_RPS", "1000"),
+        "OPENROUTER_MAX_CONCURRENCY": os.getenv("BENCH_OPENROUTER_MAX_CONCURRENCY", "64"),
+    })
+
+
+def _plan_suite() -> Suite:
+    from crew_orchestrator import plan_trip_with_crew_stream
+    from utils.flight_search import get_airport_index
+
+    def setup(scale):
+        index = get_airport_index()
+        rng = random.Random(18)
+        return [
+            (index.cities[rng.randrange(len(index.codes))], index.cities[rng.randrange(len(index.codes))],
+             rng.choice((3, 5, 7)), f"{rng.randint(5, 40) * 100} USD", rng.choice(("food", "museums", "hiking", "")))
+            for _ in range(max(2, int(8 * scale)))
+        ]
+
+    def op(spec):
+        origin, destination, days, budget, preferences = spec
+        for event in plan_trip_with_crew_stream(origin, destination, days, budget, preferences, people=2):
+            if event["type"] == "error":
+                raise RuntimeError(f"{event['agent']}: {event['result']}")
+
+    return Suite("plan", setup, op, concurrency=4)
+
+
+def _airport_code_suite() -> Suite:
+    from utils.flight_search import _get_geocode_cache, get_airport_code, get_airport_index
+
+    def setup(scale):
+        index = get_airport_index()
+        rng = random.Random(18)
+        queries = []
+        for _ in range(int(5000 * scale)):
+            i = rng.randrange(len(index.codes))
+            roll = rng.random()
+            if roll < 0.3:
+                queries.append(index.codes[i].lower())
+            elif roll < 0.8:
+                queries.append(index.cities[i])
+            elif roll < 0.95:
+                queries.append(index.names[i].split(" International")[0])
+            else:
+                # Not in the table: exercises the geocoder and its cache
+                queries.append(f"Smalltown {rng.randrange(200)}")
+        return queries
+
+    return Suite("airport_code", setup, get_airport_code, reset=lambda: _get_geocode_cache().clear())
+
+
+def _nearest_suite() -> Suite:
+    from utils.flight_search import nearest_airport
+
+    def setup(scale):
+        rng = random.Random(18)
+        return [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(int(20000 * scale))]
+
+    return Suite("nearest", setup, lambda point: nearest_airport(*point))
+
+
+def _flights_suite() -> Suite:
+    from utils import flight_search
+    from utils.flight_search import _route, _route_flights, get_airport_index, search_flights
+
+    def reset():
+        _route.cache_clear()
+        _route_flights.cache_clear()
+
+    def setup(scale):
+        codes = get_airport_index().codes
+        # Fetch every airport's arrivals up front so background refreshes don't compete with
+        # the timed passes (the search itself never waits on them)
+        for code in codes:
+            flight_search.request_arrivals_refresh(code)
+        deadline = time.monotonic() + 60
+        while flight_search._arrivals_pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        rng = random.Random(18)
+        return [(rng.choice(codes), rng.choice(codes)) for _ in range(int(5000 * scale))]
+
+    return Suite("flights", setup, lambda pair: search_flights(*pair), reset=reset)
+
+
+def _pdf_suite() -> Suite:
+    from utils import export_utils
+
+    def setup(scale):
+        # Distinct documents so the content-hash cache never answers
+        return [
+            "\n\n".join(f"# Section {s}\n" + fake_completion(f"pdf {i} {s}", 400) for s in range(4))
+            for i in range(max(2, int(20 * scale)))
+        ]
+
+    return Suite("pdf", setup, lambda text: export_utils.generate_pdf_from_text(text, title="Benchmark"),
+                 reset=export_utils._pdf_cache.clear)
+
+
+SUITES = {
+    "plan": _plan_suite,
+    "airport_code": _airport_code_suite,
+    "nearest": _nearest_suite,
+    "flights": _flights_suite,
+    "pdf": _pdf_suite,
+}
+
+
+def _drive(suite: Suite, inputs: Sequence) -> List[float]:
+    """Run op over inputs, returning per-call latencies in seconds."""
+    def timed(item):
+        started = time.perf_counter()
+        suite.op(item)
+        return time.perf_counter() - started
+
+    if suite.concurrency > 1:
+        with ThreadPoolExecutor(max_workers=suite.concurrency) as pool:
+            return list(pool.map(timed, inputs))
+    return [timed(item) for item in inputs]
+
+
+def run_suite(suite: Suite, scale: float, repeat: int = 3, measure_memory: bool = True) -> Dict:
+    """Time one suite (keeping the fastest of `repeat` passes, which is the least disturbed by
+    background work), then rerun it under tracemalloc for peak memory."""
+    inputs = suite.setup(scale)
+    suite.op(inputs[0])  # warm imports, indexes and connections
+    best = None
+    for _ in range(max(1, repeat)):
+        if suite.reset:
+            suite.reset()
+        # Like timeit, keep collector pauses out of the timings
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            latencies = sorted(_drive(suite, inputs))
+            elapsed = time.perf_counter() - started
+        finally:
+            gc.enable()
+        if best is None or elapsed < best[0]:
+            best = (elapsed, latencies)
+    elapsed, latencies = best
+
+    peak_mb = None
+    if measure_memory:
+        if suite.reset:
+            suite.reset()
+        tracemalloc.start()
+        try:
+            _drive(suite, inputs)
+            peak_mb = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "calls": len(inputs),
+        "concurrency": suite.concurrency,
+        "throughput_per_s": round(len(inputs) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_mem_mb": peak_mb,
+    }
+
+
+def comparable(baseline: Dict[str, Dict], settings: Dict) -> Dict[str, Dict]:
+    """The suites of a baseline recorded with these run settings."""
+    return {name: base for name, base in baseline.items() if base.get("settings") == settings}
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Describe every metric that is worse than the baseline by more than tolerance."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in _LOWER_IS_BETTER:
+            new, old = result.get(metric), base.get(metric)
+            if new is not None and old and new > old * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {old} → {new} (+{(new / old - 1) * 100:.0f}%)")
+        new, old = result.get("throughput_per_s"), base.get("throughput_per_s")
+        if new is not None and old and new < old * (1 - tolerance):
+            regressions.append(f"{name}.throughput_per_s: {old} → {new} ({(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def _print_table(results: Dict[str, Dict], baseline: Dict[str, Dict]):
+    columns = ("throughput_per_s", "p50_ms", "p95_ms", "p99_ms", "peak_mem_mb")
+    print(f"\n{'suite':<14}{'calls':>7}" + "".join(f"{c:>18}" for c in columns))
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        cells = []
+        for column in columns:
+            value, old = result.get(column), base.get(column)
+            change = f" ({(value / old - 1) * 100:+.0f}%)" if value is not None and old else ""
+            cells.append(f"{'-' if value is None else value}{change}".rjust(18))
+        print(f"{name:<14}{result['calls']:>7}" + "".join(cells))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a fake LLM")
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES), help="Suite to run (repeatable; default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply workload sizes (default: 1.0)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM time to first token in seconds (default: 0.2)")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0, help="Fake LLM streaming rate (default: 200)")
+    parser.add_argument("--completion-tokens", type=int, default=400, help="Fake LLM reply length (default: 400)")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE), help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Write these results into the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed regression before failing (default: 0.25)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per suite; the fastest is kept (default: 3)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    opts = parser.parse_args(argv)
+
+    baseline_path = Path(opts.baseline)
+    saved = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+    settings = {name: getattr(opts, name) for name in SETTINGS}
+    baseline = comparable(saved, settings)
+    results = {}
+
+    with FakeLLMServer(latency=opts.latency, tokens_per_sec=opts.tokens_per_sec,
+                       completion_tokens=opts.completion_tokens) as server, \
+            tempfile.TemporaryDirectory(prefix="trip-bench-") as cache_dir:
+        _configure_env(server.url, cache_dir)
+        for name in opts.suite or list(SUITES):
+            try:
+                suite = SUITES[name]()
+            except ImportError as e:
+                print(f"⏭️ {name}: skipped ({e})")
+                continue
+            print(f"⏱️ {name} ...", flush=True)
+            results[name] = run_suite(suite, opts.scale, repeat=opts.repeat, measure_memory=not opts.no_memory)
+            results[name]["settings"] = settings
+
+    _print_table(results, baseline)
+
+    if opts.save_baseline:
+        # Suites that were not run keep their previous baseline
+        baseline_path.write_text(json.dumps({**saved, **results}, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"\n💾 Baseline saved to {baseline_path}")
+        return 0
+
+    skipped = sorted(name for name in results if name in saved and name not in baseline)
+    if skipped:
+        print(f"\n⚠️ Not compared, baseline recorded with other settings: {', '.join(skipped)}"
+              f" (rerun with the same --scale/--repeat/fake server options, or --save-baseline)")
+
+    regressions = compare(results, baseline, opts.tolerance)
+    if regressions:
+        print("\n❌ Regressions beyond {:.0f}%:".format(opts.tolerance * 100))
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+    if any(name in baseline for name in results):
+        print("\n✅ No regressions")
+    elif not skipped:
+        print("\nℹ️ No baseline yet; record one with --save-baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,153 +1,507 @@
-from crewai import Crew, Task
-from agents.booking_agent import create_booking_agent
-from agents.destination_researcher import create_destination_researcher
-from agents.itinerary_planner import create_itinerary_planner
-from agents.budget_estimator import create_budget_estimator
-from langchain_openai import ChatOpenAI
 import os
-from dotenv import load_dotenv
+import queue
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from crewai import Crew, Task
+from agents.agent_pool import checkout_agent
+from utils.cache import DEFAULT_TTL, get_response_cache, llm_cache_key
+from utils.context_compaction import compact_context
+from utils.flight_search import get_airport_code, get_route
+from utils.instrumentation import agent_token_usage, notify_step_metrics, step_span, summarize_metrics
+from utils.llm_registry import get_crew_llm, get_openrouter_api_key
+from utils.plan_reuse import get_plan_reuse_index
+from utils.rate_limit import call_with_retry
+from utils.token_stream import stream_tokens
+
+LLM_MODEL = "openrouter/mistralai/mistral-7b-instruct"
+LLM_TEMPERATURE = 0.7
+
+# Token budgets for earlier results passed into later prompts
+CONTEXT_TOKEN_BUDGETS = {
+    "research": int(os.getenv("CONTEXT_BUDGET_RESEARCH", "700")),
+    "activities": int(os.getenv("CONTEXT_BUDGET_ACTIVITIES", "500")),
+    "flights": int(os.getenv("CONTEXT_BUDGET_FLIGHTS", "350")),
+    "itinerary": int(os.getenv("CONTEXT_BUDGET_ITINERARY", "900")),
+}
+
+# Itineraries longer than this many days are written in day-range chunks, concurrently, following a
+# shared outline; a single call for a long trip is slow and often truncated
+ITINERARY_CHUNK_DAYS = int(os.getenv("ITINERARY_CHUNK_DAYS", "7"))
+
+# How long each layer of a plan stays cached. Destination facts are shared by every trip to a
+# destination, activities by every trip with the same preferences, the rest by one trip.
+LAYER_TTLS = {
+    "destination": int(os.getenv("CACHE_TTL_DESTINATION", str(30 * 24 * 3600))),
+    "preferences": int(os.getenv("CACHE_TTL_PREFERENCES", str(7 * 24 * 3600))),
+    "trip": DEFAULT_TTL,
+}
 
-load_dotenv()
+# Crew steps, the steps whose results they need, the trip fields their prompts use and their
+# cache layer. Facts and flights are independent; activities build on the facts, the
+# itinerary on facts + activities and the budget on flights + itinerary.
+CREW_STEPS = (
+    {"step": 1, "agent": "Destination Research Specialist", "title": "Destination Overview", "deps": (),
+     "inputs": ("destination",), "layer": "destination"},
+    {"step": 2, "agent": "Destination Research Specialist", "title": "Activities", "deps": (1,),
+     "inputs": ("destination", "preferences"), "layer": "preferences"},
+    {"step": 3, "agent": "Flight Booking Specialist", "title": "Flight Options", "deps": (),
+     "inputs": ("origin", "destination", "people"), "layer": "trip", "airports": True},
+    {"step": 4, "agent": "Travel Itinerary Planner", "title": "Itinerary", "deps": (1, 2),
+     "inputs": ("destination", "days", "preferences", "people"), "layer": "trip", "chunked": True},
+    {"step": 5, "agent": "Travel Budget Analyst", "title": "Budget", "deps": (3, 4),
+     "inputs": ("origin", "destination", "days", "budget", "preferences", "people"), "layer": "trip"},
+)
 
 
-def plan_trip_with_crew_stream(origin: str, destination: str, days: int, budget: str, preferences: str, people: int = 1):
+def run_step_graph(steps, run_step, max_workers=None):
     """
-    Generator that runs each agent task sequentially and yields progress events.
-    Yields dicts of the form:
-      { 'type': 'start'|'done'|'final'|'error', 'step': int, 'agent': str, 'result': str|None }
-    The final event includes the full combined result in 'result'.
+    Generator that runs each step in a thread pool as soon as all of its dependencies are done.
+    run_step(spec, results, emit) is called with the step spec, a dict of finished results keyed by step
+    number and an emit(text) callback for partial output, and must return the step's result text,
+    or a (text, extra) pair whose extra dict is merged into the step's 'done' event. emit(None) takes
+    back the partial output sent so far, e.g. when a failed attempt is retried.
+    Yields 'start', 'delta', 'reset', 'done' and 'error' events in completion order and stops after the first error.
+    'done' and 'error' events carry 'metrics' with the step's queue_time_s and wall_time_s, merged with
+    any 'metrics' the step returned (or, when it raised, attached to the exception as step_metrics);
+    the metrics of finished and failed steps also go to the instrumentation listeners.
+    Returns the dict of results once every step has finished.
     """
-    # Get API key from multiple sources
-    api_key = None
-    
-    # Try environment variable first (works in HuggingFace and locally)
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    
-    # Try Streamlit secrets (for Streamlit Cloud)
-    if not api_key:
-        try:
-            import streamlit as st
-            api_key = st.secrets.get("OPENROUTER_API_KEY")
-        except:
-            pass
-    
-    if not api_key:
-        raise ValueError("OPENROUTER_API_KEY not found. Please set it in environment variables or secrets.")
-    
-    # Create LLM instance
-    llm = ChatOpenAI(
-        model="openrouter/mistralai/mistral-7b-instruct",
-        openai_api_key=api_key,
-        openai_api_base="https://openrouter.ai/api/v1",
-        temperature=0.7
-    )
+    pending = list(steps)
+    running = 0
+    results = {}
+    # Workers report partial output and completion through one queue, so the
+    # consumer sees deltas and step results in the order they happened.
+    events = queue.Queue()
+    pool = ThreadPoolExecutor(max_workers=max_workers or len(pending) or 1)
 
-    # Create agents with the LLM
-    researcher = create_destination_researcher(llm)
-    flight_agent = create_booking_agent(llm)
-    itinerary_agent = create_itinerary_planner(llm)
-    budget_agent = create_budget_estimator(llm)
+    def submit(spec):
+        emit = lambda text: events.put(("delta" if text is not None else "reset", spec, text))
+        finished = dict(results)
+        submitted = time.perf_counter()
 
-    combined_sections = []
+        def timed():
+            started = time.perf_counter()
+            timing = {"step": spec["step"], "agent": spec["agent"], "queue_time_s": round(started - submitted, 4)}
+            with step_span("crew.step", step=spec["step"], agent=spec["agent"]) as span:
+                try:
+                    out = run_step(spec, finished, emit)
+                except Exception as e:
+                    e.step_metrics = {**getattr(e, "step_metrics", {}), **timing, "failed": True,
+                                      "wall_time_s": round(time.perf_counter() - started, 4)}
+                    span.update(e.step_metrics)
+                    raise
+                text, extra = out if isinstance(out, tuple) else (out, {})
+                metrics = {**extra.get("metrics", {}), **timing, "wall_time_s": round(time.perf_counter() - started, 4)}
+                span.update(metrics)
+            return text, {**extra, "metrics": metrics}
 
-    # Step 1: Destination research
-    try:
-        yield {"type": "start", "step": 1, "agent": "Destination Research Specialist", "result": None}
-
-        research_task = Task(
-            description=(
-                f"Research the destination '{destination}' and provide:\n"
-                f"1. Overview of the city/region\n"
-                f"2. Top tourist attractions and points of interest\n"
-                f"3. Local culture and customs\n"
-                f"4. Best activities matching these preferences: {preferences}\n\n"
-                f"If you are unsure about real-time data, provide timeless highlights and typical attractions."
-            ),
-            agent=researcher,
-            expected_output="A comprehensive destination overview with attractions and activities"
-        )
-        crew1 = Crew(agents=[researcher], tasks=[research_task], verbose=False)
-        research_result = str(crew1.kickoff())
-        combined_sections.append(("Destination Research", research_result))
-        yield {"type": "done", "step": 1, "agent": "Destination Research Specialist", "result": research_result}
-    except Exception as e:
-        yield {"type": "error", "step": 1, "agent": "Destination Research Specialist", "result": str(e)}
-        return
+        future = pool.submit(timed)
+        future.add_done_callback(lambda f: events.put(("done", spec, f)))
 
-    # Step 2: Flight booking
     try:
-        yield {"type": "start", "step": 2, "agent": "Flight Booking Specialist", "result": None}
-
-        flight_task = Task(
-            description=(
-                f"Consider the trip from {origin} to {destination} for {people} traveler(s). Provide flight availability guidance,"
-                f" typical routes, nearby airports, and booking tips. If exact live data is not available,"
-                f" suggest general options and how to search effectively."
-            ),
-            agent=flight_agent,
-            expected_output="Flight options and recommendations"
+        while pending or running:
+            ready = [spec for spec in pending if all(dep in results for dep in spec["deps"])]
+            for spec in ready:
+                pending.remove(spec)
+                yield {"type": "start", "step": spec["step"], "agent": spec["agent"], "result": None}
+                submit(spec)
+                running += 1
+
+            if not running:
+                raise ValueError(f"Unsatisfiable step dependencies: {[spec['step'] for spec in pending]}")
+
+            kind, spec, payload = events.get()
+            if kind in ("delta", "reset"):
+                yield {"type": kind, "step": spec["step"], "agent": spec["agent"], "result": payload}
+                continue
+
+            running -= 1
+            try:
+                result, extra = payload.result()
+            except Exception as e:
+                metrics = getattr(e, "step_metrics", {})
+                if metrics:
+                    notify_step_metrics(metrics)
+                yield {"type": "error", "step": spec["step"], "agent": spec["agent"], "result": str(e),
+                       "metrics": metrics}
+                return results
+            notify_step_metrics(extra["metrics"])
+            results[spec["step"]] = result
+            yield {**extra, "type": "done", "step": spec["step"], "agent": spec["agent"], "result": result}
+    finally:
+        # Don't block the consumer on steps that are no longer needed (error or early close)
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def _context(name: str, text: str, context_stats: dict = None) -> str:
+    """An earlier result compacted to its CONTEXT_TOKEN_BUDGETS entry, counted in context_stats."""
+    compacted, stats = compact_context(text, CONTEXT_TOKEN_BUDGETS[name])
+    if context_stats is not None:
+        for key, value in stats.items():
+            context_stats[key] = context_stats.get(key, 0) + value
+    return compacted
+
+
+def _step_prompt(step: int, trip: dict, results: dict, context_stats: dict = None):
+    """Build the (description, expected_output) pair for a crew step.
+    Earlier results are compacted to CONTEXT_TOKEN_BUDGETS; if context_stats is given,
+    the combined token counts before and after compaction are added to it.
+    """
+    context = lambda name, text: _context(name, text, context_stats)
+    origin, destination = trip["origin"], trip["destination"]
+    days, budget = trip["days"], trip["budget"]
+    preferences, people = trip["preferences"], trip["people"]
+
+    if step == 1:
+        return (
+            f"Research the destination '{destination}' and provide:\n"
+            f"1. Overview of the city/region\n"
+            f"2. Top tourist attractions and points of interest\n"
+            f"3. Local culture and customs\n\n"
+            f"If you are unsure about real-time data, provide timeless highlights and typical attractions.",
+            "A comprehensive destination overview with attractions and customs",
         )
-        crew2 = Crew(agents=[flight_agent], tasks=[flight_task], verbose=False)
-        flight_result = str(crew2.kickoff())
-        combined_sections.append(("Flight Options", flight_result))
-        yield {"type": "done", "step": 2, "agent": "Flight Booking Specialist", "result": flight_result}
-    except Exception as e:
-        yield {"type": "error", "step": 2, "agent": "Flight Booking Specialist", "result": str(e)}
-        return
+    if step == 2:
+        return (
+            f"Suggest the best activities in '{destination}' for travelers with these preferences: {preferences or 'none given'}.\n"
+            f"Use this destination overview for context:\n{context('research', results[1])}\n\n"
+            f"List specific places, experiences and food to try, grouped by preference, with typical costs where known.",
+            "A list of activities matching the preferences",
+        )
+    if step == 3:
+        airports = ""
+        origin_code, destination_code = trip.get("airports") or (None, None)
+        if origin_code and destination_code:
+            airports = (
+                f"\n\nNearest known airports: {origin} → {origin_code}, {destination} → {destination_code}"
+                f" (about {get_route(origin_code, destination_code).distance:.0f} km apart)."
+            )
+        return (
+            f"Consider the trip from {origin} to {destination} for {people} traveler(s). Provide flight availability guidance,"
+            f" typical routes, nearby airports, and booking tips. If exact live data is not available,"
+            f" suggest general options and how to search effectively.{airports}",
+            "Flight options and recommendations",
+        )
+    if step == 4:
+        return (
+            f"Create a detailed {days}-day itinerary for {destination}. Use these findings for context:\n\n"
+            f"Destination research summary:\n{context('research', results[1])}\n\n"
+            f"Suggested activities:\n{context('activities', results[2])}\n\n"
+            f"Preferences: {preferences}\n\n"
+            f"This trip is for {people} traveler(s).\n"
+            f"Requirements:\n- Balance sightseeing with rest\n- Consider travel time between locations\n- Include meal suggestions\n- Format as Day 1, Day 2, etc., with morning/afternoon/evening",
+            f"A detailed {days}-day itinerary with daily activities",
+        )
+    if step == 5:
+        return (
+            f"Create a detailed budget breakdown for a {days}-day trip to {destination}.\n"
+            f"Travelers: {people} people.\n"
+            f"Total budget (entered): {budget}\n\n"
+            f"Consider these references (summarize where needed):\n"
+            f"- Flight options summary:\n{context('flights', results[3])}\n\n"
+            f"- Itinerary summary:\n{context('itinerary', results[4])}\n\n"
+            f"Include estimates for flights, accommodation (per night), daily food, activities, local transport, and misc.\n"
+            f"Provide per-person and total costs, a daily breakdown and grand total, and compare with the stated budget.",
+            "Detailed budget breakdown with cost estimates",
+        )
+    raise ValueError(f"Unknown crew step: {step}")
+
+
+def itinerary_chunks(days) -> list:
+    """(first_day, last_day) ranges an itinerary is written in; a single range for short trips."""
+    days = max(1, int(days))
+    size = max(1, ITINERARY_CHUNK_DAYS)
+    if days <= size:
+        return [(1, days)]
+    # Even chunks no longer than the limit, e.g. 10 days -> 1-5, 6-10 rather than 1-7, 8-10
+    count = -(-days // size)
+    bounds = [round(i * days / count) for i in range(count + 1)]
+    return [(bounds[i] + 1, bounds[i + 1]) for i in range(count)]
 
-    # Step 3: Itinerary planning
+
+def _outline_prompt(trip: dict, results: dict, context_stats: dict = None):
+    """(description, expected_output) for the day-by-day outline long itineraries are written from."""
+    context = lambda name, text: _context(name, text, context_stats)
+    days, destination = trip["days"], trip["destination"]
+    return (
+        f"Plan the outline of a {days}-day trip to {destination} for {trip['people']} traveler(s).\n\n"
+        f"Destination research summary:\n{context('research', results[1])}\n\n"
+        f"Suggested activities:\n{context('activities', results[2])}\n\n"
+        f"Preferences: {trip['preferences']}\n\n"
+        f"Write exactly one line per day, from 'Day 1:' to 'Day {days}:', giving the day's theme and the area or"
+        f" main sights it covers. Spread the activities over the whole trip without repeating them, group nearby"
+        f" sights on the same day and plan any day trips and rest days.",
+        f"A {days}-line outline, one line per day",
+    )
+
+
+def _itinerary_chunk_prompt(trip: dict, results: dict, outline: str, first: int, last: int,
+                            context_stats: dict = None):
+    """(description, expected_output) for days first..last of a long itinerary."""
+    context = lambda name, text: _context(name, text, context_stats)
+    days, destination = trip["days"], trip["destination"]
+    return (
+        f"Write days {first} to {last} of a {days}-day itinerary for {destination}, following this outline of the"
+        f" whole trip:\n{outline}\n\n"
+        f"Destination research summary:\n{context('research', results[1])}\n\n"
+        f"Suggested activities:\n{context('activities', results[2])}\n\n"
+        f"Preferences: {trip['preferences']}\n\n"
+        f"This trip is for {trip['people']} traveler(s).\n"
+        f"Requirements:\n- Only write Day {first} to Day {last}; other days are written separately\n"
+        f"- Balance sightseeing with rest\n- Consider travel time between locations\n- Include meal suggestions\n"
+        f"- Start directly with 'Day {first}' and format each day with morning/afternoon/evening",
+        f"Detailed plans for days {first} to {last}",
+    )
+
+
+def _from_day(text: str, day: int) -> str:
+    """Drop any preamble before the 'Day N' heading a chunk was asked to start with."""
+    match = re.search(rf"^\W*day\s+{day}\b", text, re.IGNORECASE | re.MULTILINE)
+    return text[match.start():].strip() if match else text.strip()
+
+
+def get_plan_llm():
+    """The crew LLM used for every plan step; raises ValueError when no API key is configured."""
+    api_key = get_openrouter_api_key()
+    if not api_key:
+        raise ValueError("OPENROUTER_API_KEY not found. Please set it in environment variables or secrets.")
+    return get_crew_llm(LLM_MODEL, api_key, LLM_TEMPERATURE)
+
+
+def step_cache_key(spec: dict, trip: dict, results: dict = None) -> str:
+    """Response-cache key of a step's prompt for this trip."""
+    description, expected_output = _step_prompt(spec["step"], trip, results or {})
+    return llm_cache_key(LLM_MODEL, LLM_TEMPERATURE, description, expected_output)
+
+
+def resolve_airports(trip: dict, prefetch=None):
+    """(origin_code, destination_code) for a trip, using prefetched lookups when available."""
+    lookup = prefetch.airport_code if prefetch is not None else get_airport_code
+    codes = []
+    for city in (trip["origin"], trip["destination"]):
+        try:
+            codes.append(lookup(city))
+        except Exception:
+            codes.append(None)
+    return tuple(codes)
+
+
+def run_crew_step(spec: dict, trip: dict, results: dict, llm, emit=None, prefetch=None):
+    """
+    Run one crew step for a trip and return (text, extra), where extra holds the step's 'metrics'
+    and, for steps given earlier results, the 'context' compaction stats.
+    A result speculated by `prefetch` for the identical prompt is used (waiting for it if it is still
+    running); otherwise the response cache and then the similarity index (utils.plan_reuse) are
+    checked before calling the LLM. metrics['reused'] is the similarity of a reused output.
+    Outputs are kept for their layer's TTL (LAYER_TTLS).
+    """
+    if spec.get("airports") and "airports" not in trip:
+        trip = {**trip, "airports": resolve_airports(trip, prefetch)}
+
+    context_stats = {}
+    description, expected_output = _step_prompt(spec["step"], trip, results, context_stats)
+    metrics = {"cache_hit": False, "prefetched": False, "reused": None, "retries": 0, "rate_limit_wait_s": 0.0,
+               "prompt_tokens": 0, "completion_tokens": 0}
+    extra = {"metrics": metrics}
+    if context_stats:
+        extra["context"] = context_stats
+
+    key = llm_cache_key(LLM_MODEL, LLM_TEMPERATURE, description, expected_output)
+    if prefetch is not None:
+        speculated = prefetch.result(spec, trip, key)
+        if speculated is not None:
+            metrics["prefetched"] = True
+            return speculated, extra
+
+    # Identical prompts (same trip details) are served from the response cache
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            metrics["cache_hit"] = True
+            return cached, extra
+
+    # Near-duplicate trips (same places and numbers, similar preferences) reuse an earlier output
+    reuse = get_plan_reuse_index()
+    if reuse is not None:
+        similar = reuse.lookup(LLM_MODEL, spec["step"], trip, spec["inputs"], max_age=LAYER_TTLS[spec["layer"]])
+        if similar is not None:
+            metrics["reused"] = similar[1]
+            return similar[0], extra
+
+    chunks = itinerary_chunks(trip["days"]) if spec.get("chunked") else []
     try:
-        yield {"type": "start", "step": 3, "agent": "Travel Itinerary Planner", "result": None}
-
-        itinerary_task = Task(
-            description=(
-                f"Create a detailed {days}-day itinerary for {destination}. Use these findings for context:\n\n"
-                f"Destination research summary:\n{research_result}\n\n"
-                f"Preferences: {preferences}\n\n"
-                f"This trip is for {people} traveler(s).\n"
-                f"Requirements:\n- Balance sightseeing with rest\n- Consider travel time between locations\n- Include meal suggestions\n- Format as Day 1, Day 2, etc., with morning/afternoon/evening"
-            ),
-            agent=itinerary_agent,
-            expected_output=f"A detailed {days}-day itinerary with daily activities"
-        )
-        crew3 = Crew(agents=[itinerary_agent], tasks=[itinerary_task], verbose=False)
-        itinerary_result = str(crew3.kickoff())
-        combined_sections.append(("Itinerary", itinerary_result))
-        yield {"type": "done", "step": 3, "agent": "Travel Itinerary Planner", "result": itinerary_result}
+        if len(chunks) > 1:
+            # The single-call prompt isn't sent; report the context of the prompts that are
+            extra["context"] = {}
+            result = _run_chunked(spec, trip, results, llm, emit, metrics, chunks, extra["context"])
+        else:
+            result = _kickoff(spec["agent"], description, expected_output, llm, emit, metrics)
     except Exception as e:
-        yield {"type": "error", "step": 3, "agent": "Travel Itinerary Planner", "result": str(e)}
-        return
+        # A failed step's retries and tokens are still reported, on its error event
+        e.step_metrics = metrics
+        raise
+    if result.strip():
+        if cache is not None:
+            cache.set(key, result, ttl=LAYER_TTLS[spec["layer"]])
+        if reuse is not None:
+            reuse.add(LLM_MODEL, spec["step"], trip, spec["inputs"], result)
+    return result, extra
+
+
+def _kickoff(role: str, description: str, expected_output: str, llm, emit, metrics: dict) -> str:
+    """One LLM call through a pooled agent; its retries, waits and tokens are added to metrics."""
+    def count_retry(attempt, delay, exc):
+        metrics["retries"] += 1
+        if emit is not None:
+            emit(None)  # the retry streams its answer from the start
+
+    def count_wait(seconds):
+        metrics["rate_limit_wait_s"] = round(metrics["rate_limit_wait_s"] + seconds, 4)
+
+    with checkout_agent(role, llm) as agent, stream_tokens(agent, emit or (lambda text: None)):
+        task = Task(description=description, agent=agent, expected_output=expected_output)
+        crew = Crew(agents=[agent], tasks=[task], verbose=False)
+        before = agent_token_usage(agent)
+        try:
+            # Rate-limited and retried on 429/5xx so a throttled step doesn't sink the whole plan
+            output = call_with_retry("openrouter", crew.kickoff, on_retry=count_retry, on_wait=count_wait)
+        finally:
+            # Read while the agent is still ours: nobody else adds to its counter in between.
+            # Tokens of attempts that failed are counted too
+            for key, value in agent_token_usage(agent).items():
+                metrics[key] += value - before[key]
+    return str(output)
+
 
-    # Step 4: Budget analysis
+def _run_chunked(spec: dict, trip: dict, results: dict, llm, emit, metrics: dict, chunks: list,
+                 context_stats: dict = None) -> str:
+    """
+    Write a long itinerary as a short outline followed by its day ranges, generated concurrently and
+    stitched back into one Day 1..N text, so latency stays roughly flat as trips get longer.
+    The first range streams live; later ones are emitted whole, in order, as they complete.
+    context_stats sums the context compaction of the outline and every range prompt.
+    """
+    outline = _kickoff(spec["agent"], *_outline_prompt(trip, results, context_stats), llm, None, metrics)
+    # Per-chunk counters, merged afterwards since the chunks run on separate threads
+    chunk_metrics = [{"retries": 0, "rate_limit_wait_s": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+                     for _ in chunks]
     try:
-        yield {"type": "start", "step": 4, "agent": "Travel Budget Analyst", "result": None}
-
-        budget_task = Task(
-            description=(
-                f"Create a detailed budget breakdown for a {days}-day trip to {destination}.\n"
-                f"Travelers: {people} people.\n"
-                f"Total budget (entered): {budget}\n\n"
-                f"Consider these references (summarize where needed):\n"
-                f"- Flight options summary:\n{flight_result}\n\n"
-                f"- Itinerary summary:\n{itinerary_result}\n\n"
-                f"Include estimates for flights, accommodation (per night), daily food, activities, local transport, and misc.\n"
-                f"Provide per-person and total costs, a daily breakdown and grand total, and compare with the stated budget."
-            ),
-            agent=budget_agent,
-            expected_output="Detailed budget breakdown with cost estimates"
-        )
-        crew4 = Crew(agents=[budget_agent], tasks=[budget_task], verbose=False)
-        budget_result = str(crew4.kickoff())
-        combined_sections.append(("Budget", budget_result))
-        yield {"type": "done", "step": 4, "agent": "Travel Budget Analyst", "result": budget_result}
-    except Exception as e:
-        yield {"type": "error", "step": 4, "agent": "Travel Budget Analyst", "result": str(e)}
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            futures = [
+                pool.submit(_kickoff, spec["agent"],
+                            *_itinerary_chunk_prompt(trip, results, outline, first, last, context_stats),
+                            llm, emit if i == 0 else None, chunk_metrics[i])
+                for i, (first, last) in enumerate(chunks)
+            ]
+            parts = []
+            for i, ((first, _), future) in enumerate(zip(chunks, futures)):
+                parts.append(_from_day(future.result(), first))
+                if i and emit is not None:
+                    emit("\n\n" + parts[-1])
+    finally:
+        # Merged even when a range failed; the pool has waited for the others by now
+        for counts in chunk_metrics:
+            for key, value in counts.items():
+                metrics[key] = round(metrics[key] + value, 4)
+        metrics["chunks"] = len(chunks)
+    return "\n\n".join(parts)
+
+
+def invalidate_layer(layer: str, trip: dict) -> int:
+    """
+    Forget the cached outputs of one layer ('destination', 'preferences' or 'trip') for a trip, e.g.
+    after a destination's facts went stale. Outputs of the steps that build on it, directly or not,
+    are dropped too (response cache and reuse index alike), since they were written from its text.
+    Returns how many steps were invalidated.
+    """
+    cache = get_response_cache()
+    reuse = get_plan_reuse_index()
+    # Dependents of an invalidated step may include the flights, whose prompt needs the airports
+    if "airports" not in trip:
+        trip = {**trip, "airports": resolve_airports(trip)}
+    # Rebuild the prompts the way a run would, from the cached results of earlier steps
+    results = {}
+    stale = set()
+    for spec in CREW_STEPS:
+        # Without the earlier results the exact prompt is unknown, so only its reuse entries can go
+        key = None
+        if cache is not None and all(dep in results for dep in spec["deps"]):
+            key = step_cache_key(spec, trip, results)
+        cached = cache.get(key) if key is not None else None
+        if cached is not None:
+            # Kept even when stale: the cached outputs of its dependents were built on this text
+            results[spec["step"]] = cached
+        if spec["layer"] != layer and not stale.intersection(spec["deps"]):
+            continue
+        if key is not None:
+            cache.delete(key)
+        if reuse is not None:
+            reuse.delete(LLM_MODEL, spec["step"], trip, spec["inputs"])
+        stale.add(spec["step"])
+    return len(stale)
+
+
+def plan_trip_with_crew_stream(origin: str, destination: str, days: int, budget: str, preferences: str, people: int = 1,
+                               prefetch=None):
+    """
+    Generator that runs the agent tasks and yields progress events.
+    Independent steps run concurrently, so events arrive in completion order.
+    Yields dicts of the form:
+      { 'type': 'start'|'delta'|'reset'|'done'|'final'|'error', 'step': int, 'agent': str, 'result': str|None }
+    'delta' events carry partial tokens of a step as the LLM streams them; the matching
+    'done' event carries the complete text. A 'reset' event means the step's call is being retried:
+    drop the partial text received for that step so far, the retry streams it again.
+    'done' events of steps that build on earlier results also carry 'context': {'tokens_before', 'tokens_after'} for the compacted context they were given.
+    'done' events carry per-step 'metrics' (queue/wall time, rate-limit wait, prompt/completion tokens,
+    retries, cache_hit, prefetched, reused); an 'error' event carries what the failed step used so far,
+    with failed=True.
+    prefetch is an optional TripPrefetcher (trip_prefetch.py) whose speculative results are reused.
+    The final event includes the full combined result in 'result' and plan totals in 'metrics'.
+    """
+    # Shared LLM instance; agents are borrowed from the process-wide pool per step
+    llm = get_plan_llm()
+
+    trip = {
+        "origin": origin,
+        "destination": destination,
+        "days": days,
+        "budget": budget,
+        "preferences": preferences,
+        "people": people,
+    }
+
+    plan_started = time.perf_counter()
+
+    def run_step(spec, results, emit):
+        return run_crew_step(spec, trip, results, llm, emit, prefetch)
+
+    step_metrics = []
+
+    def collect(graph):
+        # Pass events through, keeping step metrics and the graph's return value
+        while True:
+            try:
+                event = next(graph)
+            except StopIteration as stop:
+                return stop.value
+            if event["type"] in ("done", "error") and event.get("metrics"):
+                step_metrics.append(event["metrics"])
+            yield event
+
+    results = yield from collect(run_step_graph(CREW_STEPS, run_step))
+    if len(results) < len(CREW_STEPS):
+        # A step failed; its error event has already been yielded
         return
 
-    # Build final combined result
+    # Build final combined result, in step order regardless of completion order
     final_text_parts = []
-    for title, content in combined_sections:
-        final_text_parts.append(f"## {title}\n\n{content}\n")
+    for spec in CREW_STEPS:
+        final_text_parts.append(f"## {spec['title']}\n\n{results[spec['step']]}\n")
     final_text = "\n".join(final_text_parts)
 
-    yield {"type": "final", "step": 5, "agent": "Crew", "result": final_text}
+    # Plan totals; elapsed_s is end-to-end, so it is less than the summed step times when steps overlap
+    plan_metrics = {**summarize_metrics(step_metrics), "elapsed_s": round(time.perf_counter() - plan_started, 3)}
+    yield {"type": "final", "step": len(CREW_STEPS) + 1, "agent": "Crew", "result": final_text, "metrics": plan_metrics}
@@ -5,6 +5,8 @@ Run this file to start the Streamlit web application.
 Usage:
     python main.py              # Start web app
     python main.py --cli        # Run in terminal (old CLI mode)
+    python main.py --batch specs.jsonl [--out DIR] [--workers N] [--rate PER_MINUTE]
+                                # Pre-generate plans for every row of a JSONL/CSV file
 """
 import subprocess
 import sys
@@ -50,7 +52,7 @@ def run_web_app():
 def run_cli():
     """Run the old CLI version"""
     from dotenv import load_dotenv
-    from utils.api_utils import openrouter_chat
+    from utils.api_utils import routed_chat
 
     load_dotenv()
     # Interactive user input
@@ -77,17 +79,39 @@ def run_cli():
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt}
     ]
-    result = openrouter_chat(messages)
+    # Whichever configured provider is fastest; slow calls are hedged to the other
+    result = routed_chat(messages)
 
     print("\n\n########################")
     print("## Here is your trip plan:")
     print("########################\n")
     print(result)
 
+def run_batch_cli(args):
+    """Run batch planning from command-line arguments"""
+    import argparse
+    from batch_planner import run_batch
+
+    parser = argparse.ArgumentParser(prog="main.py --batch", description="Pre-generate trip plans in bulk")
+    parser.add_argument("specs", help="JSONL or CSV file of trip specs")
+    parser.add_argument("--out", default="batch_output", help="Output directory (default: batch_output)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent plans (default: 4)")
+    parser.add_argument("--rate", type=float, default=0, help="Max plans started per minute (default: unlimited)")
+    opts = parser.parse_args(args)
+
+    try:
+        counts = run_batch(opts.specs, out_dir=opts.out, workers=opts.workers, per_minute=opts.rate)
+    except KeyboardInterrupt:
+        print("\n⏸️ Interrupted. Run the same command again to resume.")
+        return
+    print(f"\n🏁 Done: {counts['ok']} planned, {counts['error']} failed, {counts['skipped']} skipped")
+
 def main():
     # Check if user wants CLI mode
     if len(sys.argv) > 1 and sys.argv[1] == "--cli":
         run_cli()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        run_batch_cli(sys.argv[2:])
     else:
         run_web_app()
 
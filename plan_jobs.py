@@ -0,0 +1,324 @@
+"""
+Background job queue for plan generation.
+Plans are submitted as jobs to a SQLite-backed queue and run by worker threads that are independent
+of any Streamlit session. Every event a plan yields is persisted, so a page can replay and follow a
+job after a rerun, a dropped websocket or a full refresh (the job id is kept in the URL).
+Jobs left running by a worker that stopped heartbeating (e.g. a crashed process) are requeued.
+
+Token deltas are coalesced before they are written, so the event log holds a handful of rows per
+second per step rather than one per token.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from crew_orchestrator import plan_trip_with_crew_stream
+from utils.cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.getenv("PLAN_JOB_DB", str(CACHE_DIR / "jobs.sqlite3"))
+# Plans run concurrently by this process; tune separately from the number of web sessions
+JOB_WORKERS = int(os.getenv("PLAN_JOB_WORKERS", "2"))
+# A running job whose worker has not heartbeated for this long is considered abandoned
+JOB_STALE_S = int(os.getenv("PLAN_JOB_STALE_S", "300"))
+# Finished jobs and their events are deleted after this many seconds
+JOB_RETENTION_S = int(os.getenv("PLAN_JOB_RETENTION_S", str(7 * 24 * 3600)))
+# How often buffered token deltas are written to the event log
+DELTA_FLUSH_S = 0.25
+TERMINAL_STATUSES = ("done", "error")
+
+
+class JobStore:
+    """Jobs and their event logs in SQLite. Safe to share between threads and processes."""
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, error TEXT, worker TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, PRIMARY KEY (job_id, seq))"
+        )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def submit(self, params: Dict) -> str:
+        job_id = uuid.uuid4().hex
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, params, created_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, json.dumps(params, ensure_ascii=False), time.time()),
+            )
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """Atomically move the oldest queued job to running for this worker."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id, params FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (worker, now, now, row[0]),
+            )
+        return {"id": row[0], "params": json.loads(row[1])}
+
+    def append_events(self, job_id: str, events: List[Dict]):
+        """Append events to a job's log and refresh its heartbeat."""
+        if not events:
+            return
+        with self._transaction() as conn:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), -1) FROM job_events WHERE job_id = ?", (job_id,)).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                [(job_id, seq + 1 + i, json.dumps(event, ensure_ascii=False)) for i, event in enumerate(events)],
+            )
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def heartbeat(self, job_ids: List[str]):
+        """Mark running jobs as alive even while a step is producing no events."""
+        if not job_ids:
+            return
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", [(now, job_id) for job_id in job_ids])
+
+    def finish(self, job_id: str, status: str, error: str = None):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, params, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "status", "params", "error", "created_at", "started_at", "finished_at")
+        job = dict(zip(keys, row))
+        job["params"] = json.loads(job["params"])
+        return job
+
+    def events(self, job_id: str, after: int = -1) -> List[Tuple[int, Dict]]:
+        """(seq, event) pairs logged for a job after sequence number `after`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
+
+    def requeue_stale(self, older_than: float = JOB_STALE_S) -> int:
+        """Put running jobs whose worker stopped heartbeating back in the queue. Returns how many."""
+        cutoff = time.time() - older_than
+        with self._transaction() as conn:
+            stale = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND heartbeat_at < ?", (cutoff,)
+            )]
+            for job_id in stale:
+                seq = conn.execute("SELECT COALESCE(MAX(seq), -1) FROM job_events WHERE job_id = ?", (job_id,)).fetchone()[0]
+                # Readers drop what they rendered so far when they see a restart
+                conn.execute(
+                    "INSERT INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                    (job_id, seq + 1, json.dumps({"type": "restart", "step": None, "agent": None, "result": None})),
+                )
+                conn.execute("UPDATE jobs SET status = 'queued', worker = NULL WHERE id = ?", (job_id,))
+        return len(stale)
+
+    def purge(self, older_than: float):
+        """Delete finished jobs (and their events) older than `older_than` seconds."""
+        cutoff = time.time() - older_than
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN ('done', 'error') AND finished_at < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'error') AND finished_at < ?", (cutoff,))
+
+
+class JobManager:
+    """Worker threads that claim plan jobs from a JobStore and persist their events."""
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS, poll_interval: float = 1.0):
+        self.store = store
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # In-process extras for a job (e.g. the session's TripPrefetcher); not persisted
+        self._attachments: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._running = set()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "JobManager":
+        self.store.requeue_stale()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work_loop, name=f"plan-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._housekeeping_loop, name="plan-job-housekeeping", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def submit(self, params: Dict, prefetch=None) -> str:
+        """Queue a plan; params are plan_trip_with_crew_stream's keyword arguments."""
+        # Held across the insert so a worker that claims the job straight away sees its attachments
+        with self._wakeup:
+            job_id = self.store.submit(params)
+            if prefetch is not None:
+                self._attachments[job_id] = {"prefetch": prefetch}
+            self._wakeup.notify()
+        return job_id
+
+    def _housekeeping_loop(self):
+        while True:
+            time.sleep(max(1.0, JOB_STALE_S / 4))
+            try:
+                with self._lock:
+                    running = list(self._running)
+                self.store.heartbeat(running)
+                self.store.requeue_stale()
+                self.store.purge(JOB_RETENTION_S)
+            except sqlite3.Error:
+                pass  # try again next round
+
+    def _work_loop(self):
+        while True:
+            job = self.store.claim(self.worker_id)
+            if job is None:
+                # Jobs can also be queued by other processes, so wake up periodically to check
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            with self._lock:
+                attachments = self._attachments.pop(job["id"], {})
+                self._running.add(job["id"])
+            try:
+                self._run(job, attachments)
+            except sqlite3.Error:
+                pass  # the job stops heartbeating and is requeued by the stale sweep
+            finally:
+                with self._lock:
+                    self._running.discard(job["id"])
+
+    def _run(self, job: Dict, attachments: Dict):
+        job_id = job["id"]
+        buffered = []
+        deltas: Dict[int, Dict] = {}
+        last_flush = time.monotonic()
+
+        def flush():
+            nonlocal last_flush
+            self.store.append_events(job_id, buffered + list(deltas.values()))
+            buffered.clear()
+            deltas.clear()
+            last_flush = time.monotonic()
+
+        status, error = "error", None
+        try:
+            for event in plan_trip_with_crew_stream(**job["params"], **attachments):
+                if event["type"] == "delta":
+                    # Merge consecutive tokens of a step into one delta row
+                    pending = deltas.get(event["step"])
+                    if pending is None:
+                        deltas[event["step"]] = dict(event)
+                    else:
+                        pending["result"] += event["result"] or ""
+                elif event["type"] == "reset":
+                    # Tokens of the failed attempt that aren't written yet can go
+                    deltas.pop(event["step"], None)
+                    buffered.append(event)
+                else:
+                    # Keep ordering: a step's pending tokens are written before its other events
+                    if event["step"] in deltas:
+                        buffered.append(deltas.pop(event["step"]))
+                    buffered.append(event)
+                    if event["type"] == "final":
+                        status = "done"
+                    elif event["type"] == "error":
+                        error = event.get("result")
+                if event["type"] != "delta" or time.monotonic() - last_flush >= DELTA_FLUSH_S:
+                    flush()
+            if status != "done" and error is None:
+                error = "Plan ended without a result"
+        except Exception as e:
+            error = str(e)
+            buffered.append({"type": "error", "step": None, "agent": "Crew", "result": error})
+        finally:
+            flush()
+            self.store.finish(job_id, status, error)
+
+
+def stream_job_events(store: JobStore, job_id: str, after: int = -1, poll_interval: float = 0.2,
+                      timeout: float = None) -> Iterator[Tuple[int, Dict]]:
+    """Yield (seq, event) for a job from `after` on, following the log until the job finishes."""
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        job = store.get(job_id)
+        if job is None:
+            raise KeyError(f"Unknown job: {job_id}")
+        batch = store.events(job_id, after)
+        for seq, event in batch:
+            after = seq
+            yield seq, event
+        if not batch and job["status"] in TERMINAL_STATUSES:
+            return
+        if deadline is not None and time.monotonic() > deadline:
+            return
+        if not batch:
+            time.sleep(poll_interval)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def _open_job_store() -> JobStore:
+    try:
+        return JobStore()
+    except (OSError, sqlite3.Error) as e:
+        # e.g. a read-only deployment: jobs still run, but don't survive a restart or span processes
+        logger.warning("Job database %s is unavailable (%s); keeping jobs in memory", JOB_DB_PATH, e)
+        return JobStore(":memory:")
+
+
+def get_job_manager() -> JobManager:
+    """Process-wide job manager, started on first use. Falls back to an in-memory store when the
+    job database can't be opened."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(_open_job_store()).start()
+        return _manager
@@ -0,0 +1,87 @@
+import pytest
+
+from utils import flight_search
+from utils.airport_search import AirportSearchIndex, normalize_text
+from utils.flight_search import MIN_NAME_MATCH_SCORE
+
+AIRPORTS = (
+    ("LHR", "Heathrow Airport", "London", "United Kingdom"),
+    ("YXU", "London International Airport", "London", "Canada"),
+    ("CDG", "Charles de Gaulle Airport", "Paris", "France"),
+    ("SYD", "Sydney Kingsford Smith Airport", "Sydney", "Australia"),
+    ("MEL", "Melbourne Airport", "Melbourne", "Australia"),
+    ("BCN", "Barcelona El Prat Airport", "Barcelona", "Spain"),
+    ("GRU", "São Paulo Guarulhos Airport", "São Paulo", "Brazil"),
+)
+
+
+@pytest.fixture(scope="module")
+def index():
+    return AirportSearchIndex(*zip(*AIRPORTS))
+
+
+def best(index, query):
+    matches = index.search(query, limit=1, min_score=MIN_NAME_MATCH_SCORE)
+    return matches[0][0] if matches else None
+
+
+def test_normalize_text_folds_accents_and_punctuation():
+    assert normalize_text("  São-Paulo, BRAZIL ") == "sao paulo brazil"
+
+
+@pytest.mark.parametrize("query, code", [
+    ("London, Canada", "YXU"),
+    ("London, United Kingdom", "LHR"),
+    ("Sydney, Australia", "SYD"),
+    ("sao paulo", "GRU"),
+    ("Heathrow", "LHR"),
+    ("Barcelonna", "BCN"),  # typo in a long name
+    ("yxu", "YXU"),  # exact code, though it shares no trigram with the record
+])
+def test_search_finds(index, query, code):
+    assert best(index, query) == code
+
+
+@pytest.mark.parametrize("query", [
+    "Melbourne, Florida",  # right city name, wrong country
+    "Paris, Texas",
+    "London, Ontario",
+    "Paris Texas",  # unqualified, only a partial trigram match
+    "Zanzibar",
+])
+def test_search_leaves_weak_matches_to_the_geocoder(index, query):
+    assert best(index, query) is None
+
+
+def test_search_scores_are_ranked_and_deterministic(index):
+    results = index.search("London", limit=5)
+    assert [code for code, _ in results[:2]] == ["LHR", "YXU"]  # ties keep table order
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+    assert index.search("London", limit=5) == results
+
+
+@pytest.fixture
+def geocoded(monkeypatch):
+    lookups = []
+
+    def geocode(name):
+        lookups.append(name)
+        return 0.0, 0.0
+    monkeypatch.setattr(flight_search, "geocode_city", geocode)
+    monkeypatch.setattr(flight_search, "nearest_airport", lambda lat, lon: "GEO")
+    return lookups
+
+
+@pytest.mark.parametrize("query, code", [
+    ("LHR", "LHR"),
+    ("Paris", "CDG"),
+    ("Paris, France", "CDG"),
+    ("Sydney, Australia", "SYD"),
+    ("London, Ontario", "GEO"),
+    ("Paris, Texas", "GEO"),
+    ("Melbourne, Florida", "GEO"),
+    ("Delhi, New York", "GEO"),
+])
+def test_get_airport_code(geocoded, query, code):
+    assert flight_search.get_airport_code(query) == code
+    assert geocoded == ([query] if code == "GEO" else [])
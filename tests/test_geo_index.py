@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from utils.geo_index import SphereKDTree, haversine_km
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = np.random.default_rng(7)
+    # Include the poles and both sides of the antimeridian, where lat/lon boxes would go wrong
+    lats = np.concatenate([rng.uniform(-90, 90, 2000), [90.0, -90.0, 0.0, 0.0]])
+    lons = np.concatenate([rng.uniform(-180, 180, 2000), [0.0, 0.0, 179.99, -179.99]])
+    return lats, lons
+
+
+@pytest.mark.parametrize("leaf_size", [1, 8, 32])
+def test_query_matches_brute_force(points, leaf_size):
+    lats, lons = points
+    tree = SphereKDTree(lats, lons, leaf_size=leaf_size)
+    rng = np.random.default_rng(11)
+    for lat, lon in zip(rng.uniform(-90, 90, 200), rng.uniform(-180, 180, 200)):
+        expected = np.sort(haversine_km(lat, lon, lats, lons))[:5]
+        idx, dist = tree.query(lat, lon, k=5)
+        assert np.allclose(dist, expected, atol=1e-6)
+        assert np.allclose(haversine_km(lat, lon, lats[idx], lons[idx]), dist, atol=1e-6)
+
+
+def test_query_across_the_antimeridian(points):
+    lats, lons = points
+    idx, dist = SphereKDTree(lats, lons).query(0.0, 180.0, k=2)
+    # 179.99 and -179.99 are about a kilometre either side of the query point
+    assert set(idx.tolist()) == {len(lats) - 2, len(lats) - 1}
+    assert np.all(dist < 2)
+
+
+def test_query_radius_matches_brute_force(points):
+    lats, lons = points
+    tree = SphereKDTree(lats, lons)
+    rng = np.random.default_rng(13)
+    for lat, lon in zip(rng.uniform(-90, 90, 50), rng.uniform(-180, 180, 50)):
+        distances = haversine_km(lat, lon, lats, lons)
+        idx, dist = tree.query_radius(lat, lon, 1500)
+        assert sorted(idx.tolist()) == sorted(np.flatnonzero(distances <= 1500).tolist())
+        assert np.all(np.diff(dist) >= 0)
+
+
+def test_empty_tree_and_large_k(points):
+    empty = SphereKDTree([], [])
+    assert len(empty.query(10, 10, k=3)[0]) == 0
+    assert len(empty.query_radius(10, 10, 100)[0]) == 0
+    lats, lons = points
+    assert len(SphereKDTree(lats[:3], lons[:3]).query(0, 0, k=10)[0]) == 3
@@ -0,0 +1,50 @@
+import itertools
+
+import pytest
+
+pytest.importorskip("crewai")
+
+import crew_orchestrator
+from utils.cache import MemoryCache
+from utils.plan_reuse import PlanReuseIndex
+
+TRIP = {"origin": "London", "destination": "Lisbon", "days": 3, "budget": "$2000",
+        "preferences": "food, museums", "people": 2}
+
+
+@pytest.fixture
+def planner(monkeypatch, tmp_path, request):
+    calls = itertools.count(1)
+    monkeypatch.setattr(crew_orchestrator, "_kickoff", lambda role, *args: f"{role} output {next(calls)}")
+    monkeypatch.setattr(crew_orchestrator, "get_plan_llm", lambda: object())
+    monkeypatch.setattr(crew_orchestrator, "resolve_airports", lambda trip, prefetch=None: ("LHR", "LIS"))
+    cache = MemoryCache() if request.param else None
+    monkeypatch.setattr(crew_orchestrator, "get_response_cache", lambda: cache)
+    reuse = PlanReuseIndex(tmp_path / "reuse.sqlite3")
+    monkeypatch.setattr(crew_orchestrator, "get_plan_reuse_index", lambda: reuse)
+
+    def run():
+        events = crew_orchestrator.plan_trip_with_crew_stream(**TRIP)
+        return {e["step"]: e for e in events if e["type"] == "done"}
+    return run
+
+
+def served_from_storage(event):
+    metrics = event["metrics"]
+    return metrics["cache_hit"] or metrics["reused"] is not None
+
+
+@pytest.mark.parametrize("planner", [True, False], ids=["response-cache", "reuse-only"], indirect=True)
+def test_dependent_steps_are_regenerated(planner):
+    first = planner()
+    again = planner()
+    assert all(served_from_storage(event) for event in again.values())
+
+    # The overview is the destination layer; activities, itinerary and budget build on it
+    assert crew_orchestrator.invalidate_layer("destination", TRIP) == 4
+    after = planner()
+    for step in (1, 2, 4, 5):
+        assert not served_from_storage(after[step])
+        assert after[step]["result"] != first[step]["result"]
+    assert served_from_storage(after[3])
+    assert after[3]["result"] == first[3]["result"]
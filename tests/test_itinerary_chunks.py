@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("crewai")
+
+from crew_orchestrator import ITINERARY_CHUNK_DAYS, _from_day, itinerary_chunks
+
+
+@pytest.mark.parametrize("days", range(1, 61))
+def test_chunks_cover_every_day_once(days):
+    chunks = itinerary_chunks(days)
+    assert chunks[0][0] == 1 and chunks[-1][1] == days
+    for (_, last), (first, _) in zip(chunks, chunks[1:]):
+        assert first == last + 1
+    sizes = [last - first + 1 for first, last in chunks]
+    assert all(1 <= size <= ITINERARY_CHUNK_DAYS for size in sizes)
+    # As few chunks as the limit allows, evenly sized
+    assert len(chunks) == -(-days // ITINERARY_CHUNK_DAYS)
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_short_trips_are_one_chunk():
+    assert itinerary_chunks(ITINERARY_CHUNK_DAYS) == [(1, ITINERARY_CHUNK_DAYS)]
+    assert itinerary_chunks("3") == [(1, 3)]
+    assert itinerary_chunks(0) == [(1, 1)]
+
+
+def test_from_day_drops_a_preamble():
+    assert _from_day("Sure! Here is the plan.\n\n**Day 8:** Museums", 8) == "**Day 8:** Museums"
+    assert _from_day("Day 18: later", 8) == "Day 18: later"  # no Day 8 heading: text kept as is
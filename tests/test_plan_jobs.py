@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("crewai")
+
+import plan_jobs
+from plan_jobs import JobStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(plan_jobs.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(tmp_path / "jobs.sqlite3")
+
+
+def test_requeue_stale_only_takes_back_silent_jobs(store, clock):
+    silent = store.submit({"destination": "Lisbon"})
+    clock[0] += 1
+    alive = store.submit({"destination": "Porto"})
+    assert store.claim("w1")["id"] == silent
+    assert store.claim("w2")["id"] == alive
+    store.append_events(silent, [{"type": "delta", "step": 1, "agent": "A", "result": "partial"}])
+
+    clock[0] += 200
+    store.heartbeat([alive])
+    clock[0] += 150
+    assert store.requeue_stale(older_than=300) == 1
+    assert store.get(silent)["status"] == "queued"
+    assert store.get(alive)["status"] == "running"
+
+    # Readers are told to drop what the first worker streamed; the log keeps counting up
+    seqs, events = zip(*store.events(silent))
+    assert seqs == (0, 1)
+    assert events[-1]["type"] == "restart"
+
+    # The job is claimed again, by a new worker
+    assert store.claim("w3") == {"id": silent, "params": {"destination": "Lisbon"}}
+    assert store.claim("w4") is None
+
+
+def test_requeue_stale_leaves_finished_and_queued_jobs(store, clock):
+    done = store.submit({})
+    clock[0] += 1
+    queued = store.submit({})
+    assert store.claim("w1")["id"] == done
+    store.finish(done, "done")
+    clock[0] += 10_000
+    assert store.requeue_stale(older_than=300) == 0
+    assert store.get(done)["status"] == "done"
+    assert store.get(queued)["status"] == "queued"
+    assert store.events(queued) == []
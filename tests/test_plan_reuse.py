@@ -0,0 +1,60 @@
+import pytest
+
+from utils import plan_reuse
+from utils.plan_reuse import PlanReuseIndex, trip_features
+
+ITINERARY_INPUTS = ("destination", "days", "preferences", "people")
+TRIP = {"destination": "Paris", "days": 5, "preferences": "food and museums", "people": 2}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = PlanReuseIndex(tmp_path / "reuse.sqlite3")
+    index.add("model", 4, TRIP, ITINERARY_INPUTS, "Paris itinerary")
+    return index
+
+
+def test_equivalent_trips_share_features():
+    assert trip_features(TRIP, ITINERARY_INPUTS) == trip_features(
+        {"destination": " paris ", "days": "5", "preferences": "Museums & food", "people": 2}, ITINERARY_INPUTS
+    )
+
+
+def test_lookup_reuses_a_similar_trip(index):
+    similar = {**TRIP, "preferences": "museums, food"}
+    assert index.lookup("model", 4, similar, ITINERARY_INPUTS) == ("Paris itinerary", 1.0)
+    assert index.lookup("model", 4, {**TRIP, "preferences": "nightlife"}, ITINERARY_INPUTS) is None
+
+
+@pytest.mark.parametrize("change", [{"destination": "Rome"}, {"days": 6}, {"people": 3}])
+def test_lookup_never_crosses_partitions(index, change):
+    assert index.lookup("model", 4, {**TRIP, **change}, ITINERARY_INPUTS) is None
+
+
+def test_lookup_is_scoped_to_model_and_step(index):
+    assert index.lookup("other-model", 4, TRIP, ITINERARY_INPUTS) is None
+    assert index.lookup("model", 2, TRIP, ITINERARY_INPUTS) is None
+
+
+def test_band_collisions_across_partitions_are_rejected(tmp_path, monkeypatch):
+    # Every output lands in the same LSH buckets, so only the partition check keeps them apart
+    monkeypatch.setattr(plan_reuse, "band_keys", lambda *args: (1, 2, 3))
+    index = PlanReuseIndex(tmp_path / "reuse.sqlite3")
+    index.add("model", 4, {**TRIP, "destination": "Rome"}, ITINERARY_INPUTS, "Rome itinerary")
+    assert index.lookup("model", 4, TRIP, ITINERARY_INPUTS) is None
+    index.add("model", 4, TRIP, ITINERARY_INPUTS, "Paris itinerary")
+    assert index.lookup("model", 4, TRIP, ITINERARY_INPUTS) == ("Paris itinerary", 1.0)
+
+
+def test_delete_only_drops_its_partition(index):
+    index.add("model", 4, {**TRIP, "days": 6}, ITINERARY_INPUTS, "Six days")
+    assert index.delete("model", 4, {**TRIP, "preferences": "anything"}, ITINERARY_INPUTS) == 1
+    assert index.lookup("model", 4, TRIP, ITINERARY_INPUTS) is None
+    assert index.lookup("model", 4, {**TRIP, "days": 6}, ITINERARY_INPUTS) == ("Six days", 1.0)
+
+
+def test_lookup_skips_outputs_older_than_max_age(index, monkeypatch):
+    now = plan_reuse.time.time()
+    monkeypatch.setattr(plan_reuse.time, "time", lambda: now + 3600)
+    assert index.lookup("model", 4, TRIP, ITINERARY_INPUTS, max_age=60) is None
+    assert index.lookup("model", 4, TRIP, ITINERARY_INPUTS) is not None
@@ -0,0 +1,92 @@
+import pytest
+
+from utils import rate_limit
+from utils.rate_limit import TokenBucket, call_with_retry, get_limiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(rate_limit.time, "sleep", fake.sleep)
+    return fake
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+
+def test_throttling_halves_the_rate_down_to_the_floor():
+    bucket = TokenBucket(8.0)
+    for expected in (4.0, 2.0, 1.0, 0.5, 0.5):
+        bucket.throttled()
+        assert bucket.rate == expected
+
+
+def test_success_recovers_additively_up_to_the_max():
+    bucket = TokenBucket(8.0)
+    bucket.throttled()
+    bucket.succeeded()
+    assert bucket.rate == pytest.approx(4.4)
+    for _ in range(50):
+        bucket.succeeded()
+    assert bucket.rate == 8.0
+
+
+def test_acquire_waits_at_the_backed_off_rate(clock):
+    bucket = TokenBucket(4.0, capacity=1)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.25)
+    bucket.throttled()
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.now == pytest.approx(100.75)
+
+
+def test_call_with_retry_honors_retry_after_and_throttles(clock):
+    limiter = get_limiter("test-throttled")
+    errors = [HTTPError(429, retry_after="3"), HTTPError(503)]
+    retries = []
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    rate = limiter.bucket.rate
+    assert call_with_retry("test-throttled", call, on_retry=lambda *args: retries.append(args)) == "ok"
+    assert [(attempt, delay) for attempt, delay, _ in retries][0] == (1, 3.0)
+    assert len(retries) == 2 and 0 <= retries[1][1] <= 2.0  # jittered backoff for the 503
+    assert limiter.bucket.rate == pytest.approx(rate / 2 + rate / 20)  # halved, then one success
+    assert limiter.metrics()["throttled"] == 1
+
+
+def test_call_with_retry_gives_up(clock):
+    calls = []
+
+    def fail(error):
+        calls.append(error)
+        raise error
+
+    with pytest.raises(HTTPError):
+        call_with_retry("test-fatal", lambda: fail(HTTPError(400)))
+    assert len(calls) == 1
+    with pytest.raises(HTTPError):
+        call_with_retry("test-fatal", lambda: fail(HTTPError(502)), max_attempts=3)
+    assert len(calls) == 4
+    assert get_limiter("test-fatal").metrics()["failures"] == 2
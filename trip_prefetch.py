@@ -0,0 +1,171 @@
+"""
+Speculative prefetch for the trip form.
+The destination overview and activities only depend on the destination and preferences, and airport
+lookups only on the city names, so they can start while the rest of the form is still being filled in.
+A TripPrefetcher lives in one user session: update() is called whenever the form's committed values
+change, starts work for the new values on a shared background pool and cancels speculations that no
+longer match. plan_trip_with_crew_stream(prefetch=...) then reuses a speculated result whose prompt is
+identical to the one it would send, waiting for it if it is still running.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from crew_orchestrator import CREW_STEPS, get_plan_llm, run_crew_step, step_cache_key
+from utils.airport_search import normalize_text
+from utils.cache import make_cache_key
+from utils.flight_search import get_airport_code
+from utils.llm_registry import get_openrouter_api_key
+
+# Steps shared across trips (destination and preference layers); they only build on each other and
+# use fields known before submit
+SPECULATIVE_STEPS = tuple(spec for spec in CREW_STEPS if spec["layer"] != "trip")
+# Background workers shared by every session
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+# Seconds a run waits for an in-flight airport lookup before resolving it itself
+AIRPORT_WAIT_S = 10.0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, PREFETCH_WORKERS), thread_name_prefix="prefetch")
+        return _pool
+
+
+def _prefetch_key(spec: Dict, trip: Dict) -> str:
+    """Speculation key of a step: the trip fields its prompt (and those of its deps) is built from."""
+    return make_cache_key("prefetch", spec["step"], {field: trip.get(field) for field in spec["inputs"]})
+
+
+class TripPrefetcher:
+    """Session-scoped cache of speculative step results and airport lookups."""
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._steps: "OrderedDict[str, Future]" = OrderedDict()
+        self._airports: "OrderedDict[str, Future]" = OrderedDict()
+        self._wanted = set()
+
+    def update(self, trip: Dict):
+        """Speculate for the form's current values; `trip` has the same keys as a plan request.
+        Stale speculations that have not started yet are cancelled. A running LLM call cannot be
+        interrupted, so it finishes and stays cached in case the user switches back."""
+        wanted = set()
+        speculate_steps = bool((trip.get("destination") or "").strip()) and bool(get_openrouter_api_key())
+        with self._lock:
+            if speculate_steps:
+                # Steps with no speculation yet get a future, filled in step order by one pool task
+                chain = {}
+                for spec in SPECULATIVE_STEPS:
+                    key = _prefetch_key(spec, trip)
+                    wanted.add(key)
+                    if key not in self._steps or self._steps[key].cancelled():
+                        self._steps[key] = Future()
+                        chain[key] = self._steps[key]
+                    self._steps.move_to_end(key)
+                if chain:
+                    _get_pool().submit(self._speculate_steps, chain, dict(trip))
+            for city in (trip.get("origin"), trip.get("destination")):
+                name = normalize_text(city or "")
+                if name:
+                    wanted.add(name)
+                    if name not in self._airports or self._airports[name].cancelled():
+                        self._airports[name] = _get_pool().submit(get_airport_code, city)
+                    self._airports.move_to_end(name)
+            self._wanted = wanted
+            self._prune(self._steps)
+            self._prune(self._airports)
+
+    def _prune(self, entries: "OrderedDict[str, Future]"):
+        for key, future in list(entries.items()):
+            if key not in self._wanted and future.cancel():
+                del entries[key]
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def _speculate_steps(self, chain: Dict[str, Future], trip: Dict):
+        """Run the speculative steps in order. Futures in `chain` are ours to fill; the others were
+        started by an earlier update and are only waited on for their text. Ours are marked running
+        as soon as a worker picks the chain up, which is what tells result() they are worth awaiting."""
+        with self._lock:
+            claimed = {key: future for key, future in chain.items()
+                       if self._steps.get(key) is future and key in self._wanted}
+        claimed = {key: future for key, future in claimed.items() if future.set_running_or_notify_cancel()}
+        results = {}
+        error = None
+        try:
+            for spec in SPECULATIVE_STEPS:
+                key = _prefetch_key(spec, trip)
+                if key in claimed:
+                    with self._lock:
+                        if key not in self._wanted:
+                            return  # superseded while earlier steps ran
+                    text, _ = run_crew_step(spec, trip, results, get_plan_llm())
+                    # Kept with the prompt key it answers, so a run with a different prompt ignores it
+                    claimed.pop(key).set_result((step_cache_key(spec, trip, results), text))
+                elif key in chain:
+                    return  # cancelled before we got to it; later steps can't run without it
+                else:
+                    text = self._text(self._steps.get(key))
+                    if text is None:
+                        return
+                results[spec["step"]] = text
+        except Exception as e:
+            error = e
+        finally:
+            # Whatever is left unfilled fails, so nobody waits on it: pending futures are cancelled,
+            # claimed ones get the error
+            for future in chain.values():
+                future.cancel()
+            for future in claimed.values():
+                future.set_exception(error or RuntimeError("Speculation abandoned"))
+
+    @staticmethod
+    def _text(future: Optional[Future]) -> Optional[str]:
+        if future is None or future.cancelled():
+            return None
+        try:
+            return future.result()[1]
+        except Exception:
+            return None
+
+    def result(self, spec: Dict, trip: Dict, prompt_key: str) -> Optional[str]:
+        """Speculated text for a step of this trip, waiting if it is already running; None if there is
+        no usable speculation (not started, cancelled, failed or made for a different prompt).
+        Speculation still queued behind other sessions' work is cancelled so the step runs inline."""
+        with self._lock:
+            future = self._steps.get(_prefetch_key(spec, trip))
+        # cancel() only succeeds for work no worker has picked up yet
+        if future is None or future.cancel():
+            return None
+        try:
+            key, text = future.result()
+        except Exception:
+            return None
+        return text if key == prompt_key else None
+
+    def airport_code(self, city: str) -> Optional[str]:
+        """Airport code for a city, from a prefetched lookup when one has started."""
+        with self._lock:
+            future = self._airports.get(normalize_text(city or ""))
+        if future is not None and not future.cancel():
+            try:
+                return future.result(timeout=AIRPORT_WAIT_S)
+            except Exception:
+                pass
+        return get_airport_code(city)
+
+    def cancel(self):
+        """Drop every speculation that has not started yet (e.g. when the form is cleared)."""
+        with self._lock:
+            self._wanted = set()
+            self._prune(self._steps)
+            self._prune(self._airports)
@@ -0,0 +1,112 @@
+"""Ranked fuzzy search over airport cities, names and countries.
+Text is lower-cased and accent-folded ("São Paulo" -> "sao paulo"), and a trigram index
+narrows each query to a few candidates before they are scored. Results are deterministic:
+ties keep the order of the airport table.
+"""
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Sequence, Set, Tuple
+
+# Relative weight of a match on each field
+FIELD_WEIGHTS = (("city", 1.0), ("name", 0.95), ("country", 0.6))
+# For "place, country" queries: share of the score from the place part (the rest from the country)
+PLACE_WEIGHT = 0.8
+# ...and how well the part after the comma must match the country for that score to count
+MIN_COUNTRY_SCORE = 0.75
+# Trigram similarity below which a field with no substring match counts as no match at all, so
+# "Paris Texas" isn't taken for Paris but left to the geocoder
+MIN_TRIGRAM_SIMILARITY = 0.75
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_text(text: str) -> str:
+    """Lower-case, strip accents and punctuation, and collapse whitespace."""
+    folded = unicodedata.normalize("NFKD", text or "")
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", folded.lower()).split())
+
+
+def trigrams(text: str) -> Set[str]:
+    """Padded character trigrams of already-normalized text."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _field_score(query: str, query_grams: Set[str], field: str, field_grams: Set[str]) -> float:
+    if not field:
+        return 0.0
+    if query == field:
+        return 1.0
+    coverage = len(query) / len(field)
+    if field.startswith(query) or f" {query}" in f" {field}":
+        return 0.85 + 0.1 * coverage
+    if query in field:
+        return 0.75 + 0.1 * coverage
+    similarity = 2 * len(query_grams & field_grams) / (len(query_grams) + len(field_grams))
+    return 0.8 * similarity if similarity >= MIN_TRIGRAM_SIMILARITY else 0.0
+
+
+class AirportSearchIndex:
+    """Trigram index over the airport table, built once alongside the AirportIndex."""
+
+    def __init__(self, codes: Sequence[str], names: Sequence[str], cities: Sequence[str], countries: Sequence[str]):
+        self.codes = tuple(codes)
+        self._by_code = {code: i for i, code in enumerate(self.codes)}
+        self._fields = []
+        postings: Dict[str, List[int]] = {}
+        for i in range(len(self.codes)):
+            fields = {"city": normalize_text(cities[i]), "name": normalize_text(names[i]), "country": normalize_text(countries[i])}
+            grams = {key: trigrams(value) for key, value in fields.items()}
+            self._fields.append((fields, grams))
+            for gram in set().union(*grams.values()):
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: tuple(ids) for gram, ids in postings.items()}
+
+    def search(self, query: str, limit: int = 5, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """Return up to `limit` (code, score) pairs ranked best first. Scores are in [0, 1]."""
+        q = normalize_text(query)
+        if not q:
+            return []
+        q_grams = trigrams(q)
+        # "Sydney, Australia": the place part is matched against city/name, the rest against country
+        head, _, rest = (query or "").partition(",")
+        place, qualifier = normalize_text(head), normalize_text(rest)
+        qualified = bool(place and qualifier)
+        if qualified:
+            place_grams, qualifier_grams = trigrams(place), trigrams(qualifier)
+
+        # Candidates must share a reasonable fraction of the query's trigrams
+        hits = Counter()
+        for gram in q_grams:
+            hits.update(self._postings.get(gram, ()))
+        needed = max(1, int(len(q_grams) * 0.3))
+        candidates = {i for i, count in hits.items() if count >= needed}
+
+        exact_code = query.strip().upper()
+        ranked = []
+        for i in candidates:
+            fields, grams = self._fields[i]
+            score = max(
+                weight * _field_score(q, q_grams, fields[key], grams[key])
+                for key, weight in FIELD_WEIGHTS
+            )
+            if qualified:
+                place_score = max(
+                    weight * _field_score(place, place_grams, fields[key], grams[key])
+                    for key, weight in FIELD_WEIGHTS[:2]
+                )
+                country_score = _field_score(qualifier, qualifier_grams, fields["country"], grams["country"])
+                if country_score >= MIN_COUNTRY_SCORE:
+                    score = max(score, PLACE_WEIGHT * place_score + (1 - PLACE_WEIGHT) * country_score)
+            if self.codes[i] == exact_code:
+                score = 1.0
+            if score >= min_score:
+                ranked.append((-score, i))
+        # A short code can share too few trigrams with the query to be a candidate
+        if exact_code in self._by_code and self._by_code[exact_code] not in candidates:
+            ranked.append((-1.0, self._by_code[exact_code]))
+
+        ranked.sort()
+        return [(self.codes[i], round(-neg, 4)) for neg, i in ranked[:limit]]
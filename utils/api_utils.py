@@ -1,66 +1,68 @@
-def openrouter_chat(messages, model="mistralai/mistral-7b-instruct"): 
+import os
+from dotenv import load_dotenv
+from utils.llm_registry import get_async_http_client, run_sync, OPENROUTER_BASE_URL, HF_ROUTER_BASE_URL
+from utils.provider_routing import hedged_call
+from utils.rate_limit import async_call_with_retry
+
+load_dotenv()
+
+GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
+OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
+SKYSCANNER_API_KEY = os.getenv("SKYSCANNER_API_KEY")
+BOOKING_COM_API_KEY = os.getenv("BOOKING_COM_API_KEY")
+EVENTBRITE_API_KEY = os.getenv("EVENTBRITE_API_KEY")
+OPENTRIPMAP_KEY = os.getenv("OPENTRIPMAP_KEY")
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
+
+async def _chat_completion(provider, base_url, api_key, model, messages):
+	"""POST an OpenAI-compatible chat completion through the shared async client and the provider's
+	rate limiter (retried on 429/5xx). Returns the response text; raises on failure."""
+	client = get_async_http_client()
+	async def post():
+		response = await client.post(
+			f"{base_url}/chat/completions",
+			headers={"Authorization": f"Bearer {api_key}"},
+			json={"model": model, "messages": messages},
+		)
+		response.raise_for_status()
+		return response.json()
+	data = await async_call_with_retry(provider, post)
+	return data["choices"][0]["message"]["content"]
+
+async def openrouter_chat_async(messages, model="mistralai/mistral-7b-instruct"):
 	"""
 	Use OpenRouter.ai's OpenAI-compatible endpoint for chat completion.
+	Calls go through the shared OpenRouter rate limiter and are retried on 429/5xx.
 	messages: list of dicts, e.g. [{"role": "user", "content": "..."}]
 	model: model string, default is mistralai/mistral-7b-instruct
 	Returns the response text or error message.
 	"""
-	import os
-	from openai import OpenAI
-	from dotenv import load_dotenv
-	load_dotenv()
-	client = OpenAI(
-		base_url="https://openrouter.ai/api/v1",
-		api_key=os.environ.get("OPENROUTER_API_KEY")
-	)
 	try:
-		completion = client.chat.completions.create(
-			model=model,
-			messages=messages,
-		)
-		return completion.choices[0].message.content
+		return await _chat_completion("openrouter", OPENROUTER_BASE_URL, os.environ.get("OPENROUTER_API_KEY"), model, messages)
 	except Exception as e:
 		return f"Request failed: {e}"
-def hf_openai_chat(messages, model="mistralai/Mistral-7B-Instruct-v0.2:featherless-ai"): 
+def openrouter_chat(messages, model="mistralai/mistral-7b-instruct"): 
+	"""Blocking version of openrouter_chat_async."""
+	return run_sync(openrouter_chat_async(messages, model))
+async def hf_openai_chat_async(messages, model="mistralai/Mistral-7B-Instruct-v0.2:featherless-ai"):
 	"""
 	Use Hugging Face's OpenAI-compatible endpoint for chat completion.
+	Calls go through the shared Hugging Face rate limiter and are retried on 429/5xx.
 	messages: list of dicts, e.g. [{"role": "user", "content": "..."}]
 	model: model string, default is Mistral-7B-Instruct-v0.2:featherless-ai
 	Returns the response text or error message.
 	"""
-	import os
-	from openai import OpenAI
-	from dotenv import load_dotenv
-	load_dotenv()
-	client = OpenAI(
-		base_url="https://router.huggingface.co/v1",
-		api_key=os.environ.get("HF_TOKEN") or os.environ.get("HUGGINGFACE_API_KEY")
-	)
+	api_key = os.environ.get("HF_TOKEN") or os.environ.get("HUGGINGFACE_API_KEY")
 	try:
-		completion = client.chat.completions.create(
-			model=model,
-			messages=messages,
-		)
-		return completion.choices[0].message.content
+		return await _chat_completion("huggingface", HF_ROUTER_BASE_URL, api_key, model, messages)
 	except Exception as e:
 		return f"Request failed: {e}"
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
-OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
-SKYSCANNER_API_KEY = os.getenv("SKYSCANNER_API_KEY")
-BOOKING_COM_API_KEY = os.getenv("BOOKING_COM_API_KEY")
-EVENTBRITE_API_KEY = os.getenv("EVENTBRITE_API_KEY")
-OPENTRIPMAP_KEY = os.getenv("OPENTRIPMAP_KEY")
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
-
-import requests
-def hf_llama2_generate(prompt, model="mistralai/Mistral-7B-Instruct-v0.2", max_tokens=256):
+def hf_openai_chat(messages, model="mistralai/Mistral-7B-Instruct-v0.2:featherless-ai"): 
+	"""Blocking version of hf_openai_chat_async."""
+	return run_sync(hf_openai_chat_async(messages, model))
+async def hf_llama2_generate_async(prompt, model="mistralai/Mistral-7B-Instruct-v0.2", max_tokens=256):
 	"""
 	Generate text using Hugging Face Inference API (Mistral-7B-Instruct-v0.2 by default).
 	Returns the generated text or error message.
@@ -68,9 +70,13 @@ def hf_llama2_generate(prompt, model="mistralai/Mistral-7B-Instruct-v0.2", max_t
 	api_url = f"https://api-inference.huggingface.co/models/{model}"
 	headers = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}"}
 	payload = {"inputs": prompt, "parameters": {"max_new_tokens": max_tokens}}
+	client = get_async_http_client()
 	try:
-		response = requests.post(api_url, headers=headers, json=payload, timeout=60)
-		response.raise_for_status()
+		async def post():
+			response = await client.post(api_url, headers=headers, json=payload, timeout=60)
+			response.raise_for_status()
+			return response
+		response = await async_call_with_retry("huggingface", post)
 		data = response.json()
 		if isinstance(data, dict) and data.get("error"):
 			return f"Error: {data['error']}"
@@ -82,4 +88,39 @@ def hf_llama2_generate(prompt, model="mistralai/Mistral-7B-Instruct-v0.2", max_t
 			return data[0]["generated_texts"][0]
 		return str(data)
 	except Exception as e:
-		return f"Request failed: {e}"
\ No newline at end of file
+		return f"Request failed: {e}"
+# Equivalent chat models on each OpenAI-compatible provider routed_chat can pick from
+ROUTED_CHAT_MODELS = {
+	"openrouter": "mistralai/mistral-7b-instruct",
+	"huggingface": "mistralai/Mistral-7B-Instruct-v0.2:featherless-ai",
+}
+async def routed_chat_async(messages, models=None):
+	"""
+	Chat completion on whichever configured provider (OpenRouter, Hugging Face) is currently fastest.
+	A call that runs past the provider's usual latency is hedged to the other one and the first answer
+	wins; see utils.provider_routing.
+	models: optional {provider: model} overrides of ROUTED_CHAT_MODELS
+	Returns the response text or error message.
+	"""
+	models = {**ROUTED_CHAT_MODELS, **(models or {})}
+	endpoints = {
+		"openrouter": (OPENROUTER_BASE_URL, os.environ.get("OPENROUTER_API_KEY")),
+		"huggingface": (HF_ROUTER_BASE_URL, os.environ.get("HF_TOKEN") or os.environ.get("HUGGINGFACE_API_KEY")),
+	}
+	calls = {
+		name: (lambda name=name, base_url=base_url, api_key=api_key:
+			_chat_completion(name, base_url, api_key, models[name], messages))
+		for name, (base_url, api_key) in endpoints.items() if api_key
+	}
+	if not calls:
+		return "Request failed: no OPENROUTER_API_KEY or HF_TOKEN configured"
+	try:
+		return await hedged_call(calls)
+	except Exception as e:
+		return f"Request failed: {e}"
+def routed_chat(messages, models=None):
+	"""Blocking version of routed_chat_async."""
+	return run_sync(routed_chat_async(messages, models))
+def hf_llama2_generate(prompt, model="mistralai/Mistral-7B-Instruct-v0.2", max_tokens=256):
+	"""Blocking version of hf_llama2_generate_async."""
+	return run_sync(hf_llama2_generate_async(prompt, model, max_tokens))
\ No newline at end of file
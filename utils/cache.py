@@ -0,0 +1,268 @@
+"""Caching for LLM responses and other slow lookups.
+Provides an in-process LRU tier and an on-disk SQLite tier, both with TTL and size-based eviction,
+plus a tiered cache that checks them in order. Every cache exposes hit/miss counters via stats().
+SingleFlight coalesces concurrent misses for the same key into one call.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Optional
+
+CACHE_DIR = Path(os.getenv("TRIP_PLANNER_CACHE_DIR", str(Path(__file__).parent.parent / ".cache")))
+DEFAULT_TTL = int(os.getenv("TRIP_PLANNER_CACHE_TTL", str(24 * 3600)))
+
+
+def make_cache_key(*parts) -> str:
+    """Content-addressed key: SHA-256 over the JSON encoding of the parts."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def llm_cache_key(model: str, temperature: float, description: str, expected_output: str = "") -> str:
+    """Cache key for an LLM task: model, temperature and the rendered task text."""
+    return make_cache_key("llm", model, float(temperature), description, expected_output)
+
+
+class MemoryCache:
+    """Thread-safe in-process LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 256, ttl: int = DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[tuple]:
+        """Return (value, expires_at) or None."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._data)}
+
+
+class SQLiteCache:
+    """On-disk cache in a SQLite table. Values are stored as JSON.
+    Expired rows are purged on write, and the least recently used rows are evicted past max_entries.
+    """
+
+    def __init__(self, path: str, table: str = "responses", max_entries: int = 5000, ttl: int = DEFAULT_TTL):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid cache table name: {table}")
+        self.path = str(path)
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[tuple]:
+        """Return (value, expires_at) or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, expires, now),
+            )
+            self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": count}
+
+
+class TieredCache:
+    """Checks each tier in order and promotes hits from slower tiers into the faster ones."""
+
+    def __init__(self, *tiers):
+        self.tiers = tiers
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[tuple]:
+        """Return (value, expires_at) or None."""
+        for i, tier in enumerate(self.tiers):
+            entry = tier.get_entry(key)
+            if entry is not None:
+                # Promoted copies keep the original expiry (short-lived entries stay short-lived)
+                remaining = max(0.0, entry[1] - time.time())
+                for faster in self.tiers[:i]:
+                    faster.set(key, entry[0], ttl=remaining)
+                with self._lock:
+                    self.hits += 1
+                return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        for tier in self.tiers:
+            tier.set(key, value, ttl=ttl)
+
+    def delete(self, key: str):
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            summary = {"hits": self.hits, "misses": self.misses}
+        summary["tiers"] = [tier.stats() for tier in self.tiers]
+        return summary
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key: the first caller runs fn, the rest wait for its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: str, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Future()
+                self._calls[key] = call
+        if not leader:
+            return call.result()
+        try:
+            result = fn()
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+def open_tiered_cache(filename: str, table: str, ttl: int = DEFAULT_TTL, memory_entries: int = 256,
+                      disk_entries: int = 5000) -> TieredCache:
+    """Memory LRU in front of a SQLite table under CACHE_DIR.
+    Falls back to the memory tier alone when the cache directory isn't writable
+    (e.g. some hosted deployments).
+    """
+    memory = MemoryCache(max_entries=memory_entries, ttl=ttl)
+    try:
+        disk = SQLiteCache(CACHE_DIR / filename, table=table, max_entries=disk_entries, ttl=ttl)
+    except (OSError, sqlite3.Error):
+        return TieredCache(memory)
+    return TieredCache(memory, disk)
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide LLM response cache (memory LRU in front of SQLite), or None if disabled.
+    Set TRIP_PLANNER_CACHE=off to disable it.
+    """
+    global _response_cache
+    if os.getenv("TRIP_PLANNER_CACHE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = open_tiered_cache("llm_cache.sqlite3", table="responses")
+        return _response_cache
+
+
+def set_response_cache(cache):
+    """Replace the process-wide response cache. Any object with get/set works; None resets to the default."""
+    global _response_cache
+    with _response_cache_lock:
+        _response_cache = cache
@@ -0,0 +1,66 @@
+"""Deterministic compaction of earlier agent outputs before they are passed to later steps.
+Lines are ranked by how much structure they carry (headings, day markers, prices and figures,
+bullets) and the best ones are kept, in their original order, until a token budget is reached.
+"""
+import math
+import re
+from typing import Tuple
+
+_DAY_RE = re.compile(r'^(day\s*\d+|morning|afternoon|evening)\b', re.IGNORECASE)
+_FIGURE_RE = re.compile(r'(\d|[$€£¥₹]|\b(usd|eur|gbp|inr)\b)', re.IGNORECASE)
+_EMPHASIS_RE = re.compile(r'[*_`~]+')
+MAX_LINE_CHARS = 240
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)."""
+    return math.ceil(len(text or "") / 4)
+
+
+def _line_priority(line: str) -> int:
+    if line.startswith('#'):
+        return 3
+    if _DAY_RE.match(line.lstrip('-•* ')):
+        return 3
+    if _FIGURE_RE.search(line):
+        return 2
+    if line.startswith(('-', '•', '*')) or line[:3].rstrip('.').isdigit():
+        return 1
+    return 0
+
+
+def compact_context(text: str, max_tokens: int) -> Tuple[str, dict]:
+    """
+    Shrink text to roughly max_tokens, keeping its most informative lines.
+    Returns (compacted_text, stats) where stats has tokens_before and tokens_after.
+    Text already within budget is returned unchanged.
+    """
+    text = text or ""
+    before = estimate_tokens(text)
+    if before <= max_tokens:
+        return text, {"tokens_before": before, "tokens_after": before}
+
+    lines = []
+    seen = set()
+    for raw in text.split('\n'):
+        line = " ".join(_EMPHASIS_RE.sub('', raw).split())
+        if not line or line.lower() in seen:
+            continue
+        seen.add(line.lower())
+        if len(line) > MAX_LINE_CHARS:
+            line = line[:MAX_LINE_CHARS].rsplit(' ', 1)[0] + '…'
+        lines.append(line)
+
+    # Highest priority first; earlier lines win ties so the result is stable
+    ranked = sorted(range(len(lines)), key=lambda i: (-_line_priority(lines[i]), i))
+    budget = max_tokens
+    keep = set()
+    for i in ranked:
+        cost = estimate_tokens(lines[i]) + 1
+        if cost > budget:
+            continue
+        keep.add(i)
+        budget -= cost
+
+    compacted = "\n".join(lines[i] for i in sorted(keep))
+    return compacted, {"tokens_before": before, "tokens_after": estimate_tokens(compacted)}
@@ -1,110 +1,200 @@
 from io import BytesIO
+from typing import Iterable, Iterator, Union, Tuple
 from reportlab.lib.pagesizes import LETTER
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Frame
+from reportlab.platypus.doctemplate import LayoutError
 from reportlab.lib.enums import TA_LEFT
 import re
+from utils.cache import MemoryCache, make_cache_key
+
+# Styles and patterns are built once per process instead of on every export
+_styles = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_styles['Heading1'],
+    fontSize=18,
+    textColor='#1a1a1a',
+    spaceAfter=20,
+    alignment=TA_LEFT
+)
+
+HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=_styles['Heading2'],
+    fontSize=14,
+    textColor='#2c3e50',
+    spaceAfter=12,
+    spaceBefore=12,
+    alignment=TA_LEFT
+)
+
+SUBHEADING_STYLE = ParagraphStyle(
+    'CustomSubheading',
+    parent=_styles['Heading3'],
+    fontSize=12,
+    textColor='#34495e',
+    spaceAfter=10,
+    spaceBefore=10,
+    alignment=TA_LEFT
+)
+
+BODY_STYLE = ParagraphStyle(
+    'CustomBody',
+    parent=_styles['Normal'],
+    fontSize=10,
+    textColor='#333333',
+    spaceAfter=8,
+    alignment=TA_LEFT,
+    leading=14
+)
+
+_BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+_ITALIC_RE = re.compile(r'(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)')
+
+_STYLES = {"heading": HEADING_STYLE, "subheading": SUBHEADING_STYLE, "body": BODY_STYLE}
+
+# Finished PDFs keyed by a hash of title + text
+_pdf_cache = MemoryCache(max_entries=16)
+
+
+def _parse_line(line: str) -> tuple:
+    """Convert one markdown line into a (kind, markup) item."""
+    line = line.strip()
+
+    if not line:
+        return ("spacer", None)
+
+    # Convert markdown to HTML for ReportLab
+    # Handle headers (## or ###)
+    if line.startswith('### '):
+        return ("subheading", line[4:].strip())
+    if line.startswith('## '):
+        return ("heading", line[3:].strip())
+    if line.startswith('# '):
+        return ("heading", line[2:].strip())
+
+    # Convert markdown bold (**text**) to HTML bold (<b>text</b>)
+    html_line = _BOLD_RE.sub(r'<b>\1</b>', line)
+
+    # Convert markdown italic (*text*) to HTML italic (<i>text</i>)
+    html_line = _ITALIC_RE.sub(r'<i>\1</i>', html_line)
+
+    # Handle bullet points
+    if html_line.startswith('- ') or html_line.startswith('• '):
+        html_line = '• ' + html_line[2:]
+
+    # Escape special characters but keep our HTML tags
+    # (ReportLab's Paragraph handles basic HTML)
+
+    return ("body", html_line)
+
+
+def _flowable(kind: str, markup):
+    if kind == "spacer":
+        return Spacer(1, 0.1*inch)
+    return Paragraph(markup, _STYLES[kind])
+
+
+def _build_story(text: str, title: str) -> list:
+    story = [Paragraph(title, TITLE_STYLE), Spacer(1, 0.2*inch)]
+    for line in text.split('\n'):
+        story.append(_flowable(*_parse_line(line)))
+    return story
 
 
 def generate_pdf_from_text(text: str, title: str = "Trip Plan") -> bytes:
-    """Generate a PDF from markdown-formatted text with proper styling."""
+    """Generate a PDF from markdown-formatted text with proper styling.
+    Results are cached by content hash, so re-exporting the same plan is free.
+    """
+    key = make_cache_key("pdf", title, text)
+    cached = _pdf_cache.get(key)
+    if cached is not None:
+        return cached
+
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=LETTER, 
+    doc = SimpleDocTemplate(buffer, pagesize=LETTER,
                            leftMargin=1*inch, rightMargin=1*inch,
                            topMargin=1*inch, bottomMargin=1*inch)
-    
-    # Get styles
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor='#1a1a1a',
-        spaceAfter=20,
-        alignment=TA_LEFT
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor='#2c3e50',
-        spaceAfter=12,
-        spaceBefore=12,
-        alignment=TA_LEFT
-    )
-    
-    subheading_style = ParagraphStyle(
-        'CustomSubheading',
-        parent=styles['Heading3'],
-        fontSize=12,
-        textColor='#34495e',
-        spaceAfter=10,
-        spaceBefore=10,
-        alignment=TA_LEFT
-    )
-    
-    body_style = ParagraphStyle(
-        'CustomBody',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor='#333333',
-        spaceAfter=8,
-        alignment=TA_LEFT,
-        leading=14
-    )
-    
-    # Build document
-    story = []
-    
-    # Add title
-    story.append(Paragraph(title, title_style))
-    story.append(Spacer(1, 0.2*inch))
-    
-    # Process text line by line
-    lines = text.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        
-        if not line:
-            story.append(Spacer(1, 0.1*inch))
-            continue
-        
-        # Convert markdown to HTML for ReportLab
-        # Handle headers (## or ###)
-        if line.startswith('### '):
-            clean_line = line[4:].strip()
-            story.append(Paragraph(clean_line, subheading_style))
-        elif line.startswith('## '):
-            clean_line = line[3:].strip()
-            story.append(Paragraph(clean_line, heading_style))
-        elif line.startswith('# '):
-            clean_line = line[2:].strip()
-            story.append(Paragraph(clean_line, heading_style))
-        else:
-            # Convert markdown bold (**text**) to HTML bold (<b>text</b>)
-            html_line = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', line)
-            
-            # Convert markdown italic (*text*) to HTML italic (<i>text</i>)
-            html_line = re.sub(r'(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)', r'<i>\1</i>', html_line)
-            
-            # Handle bullet points
-            if html_line.startswith('- ') or html_line.startswith('• '):
-                html_line = '• ' + html_line[2:]
-            
-            # Escape special characters but keep our HTML tags
-            # (ReportLab's Paragraph handles basic HTML)
-            
-            story.append(Paragraph(html_line, body_style))
-    
+
     # Build PDF
-    doc.build(story)
-    
+    doc.build(_build_story(text, title))
+
     pdf_bytes = buffer.getvalue()
     buffer.close()
+    _pdf_cache.set(key, pdf_bytes)
     return pdf_bytes
+
+
+def sections_from_events(events: Iterable[dict], titles: dict = None) -> Iterator[Tuple[str, str]]:
+    """
+    Turn plan_trip_with_crew_stream events into (heading, markdown) sections in step order.
+    Steps can finish out of order; a finished step is held only until the steps before it are done.
+    titles maps step numbers to headings (defaults to the agent name).
+    """
+    titles = titles or {}
+    held = {}
+    next_step = 1
+    for event in events:
+        if event.get("type") == "error":
+            raise RuntimeError(f"{event.get('agent', 'Agent')} failed: {event.get('result')}")
+        if event.get("type") != "done":
+            continue
+        held[event["step"]] = (titles.get(event["step"], event.get("agent", "")), event.get("result") or "")
+        while next_step in held:
+            yield held.pop(next_step)
+            next_step += 1
+    # Anything left had a gap before it (e.g. unnumbered extra steps)
+    for step in sorted(held):
+        yield held[step]
+
+
+def stream_pdf(sections: Iterable[Union[str, Tuple[str, str]]], sink, title: str = "Trip Plan") -> int:
+    """
+    Write a PDF to a file-like sink (or path) while consuming markdown sections from an iterable,
+    e.g. sections_from_events(plan_trip_with_crew_stream(...)).
+    Each section is a markdown string or a (heading, markdown) pair. Sections are laid out as they
+    arrive, so layout overlaps generation instead of waiting for the whole plan. ReportLab keeps the
+    finished pages in memory and writes the file on save(), so memory still grows with the page
+    count. Returns the number of pages written.
+    """
+    canv = canvas.Canvas(sink, pagesize=LETTER, pageCompression=1)
+    width, height = LETTER
+    pages = 1
+
+    def new_frame():
+        return Frame(1*inch, 1*inch, width - 2*inch, height - 2*inch, id='normal')
+
+    frame = new_frame()
+
+    def place(flowable):
+        nonlocal frame, pages
+        while True:
+            if frame.add(flowable, canv):
+                return
+            parts = frame.split(flowable, canv)
+            if len(parts) > 1 and frame.add(parts[0], canv):
+                for part in parts[1:-1]:
+                    place(part)
+                flowable = parts[-1]
+                continue
+            if frame._atTop:
+                raise LayoutError(f"Flowable {flowable.identity(30)} too large to fit on a page")
+            canv.showPage()
+            pages += 1
+            frame = new_frame()
+
+    place(Paragraph(title, TITLE_STYLE))
+    place(Spacer(1, 0.2*inch))
+    for section in sections:
+        if isinstance(section, tuple):
+            heading, body = section
+            section = f"## {heading}\n\n{body}\n"
+        for line in section.split('\n'):
+            place(_flowable(*_parse_line(line)))
+
+    canv.save()
+    return pages
@@ -3,37 +3,149 @@ OpenSky provides real-time flight tracking data without requiring an API key for
 Includes city geocoding via OpenTripMap to map user inputs to nearest known airports.
 """
 import os
-import requests
 import json
+import queue
+import threading
+import time
+from array import array
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Tuple
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Optional, List, Tuple
 import math
 from pathlib import Path
 from dotenv import load_dotenv
+from utils.cache import SingleFlight, open_tiered_cache
+from utils.llm_registry import get_http_client
+from utils.airport_search import AirportSearchIndex, normalize_text
+from utils.geo_index import SphereKDTree, haversine_km
+import numpy as np
 
 load_dotenv()
 
-OPENSKY_API_BASE = "https://opensky-network.org/api"
+OPENSKY_API_BASE = os.getenv("OPENSKY_API_BASE", "https://opensky-network.org/api")
+OPENTRIPMAP_API_BASE = os.getenv("OPENTRIPMAP_API_BASE", "https://api.opentripmap.com/0.1/en")
+# Estimate model shared by search_flights and search_flights_matrix
+BASE_FARE = 50
+FARE_PER_KM = 0.15
+DIRECT_SPEED_KMH = 800
+CONNECTING_SPEED_KMH = 600  # slower effective speed due to layover
+MIN_DIRECT_DURATION = 45 * 60
+MIN_CONNECTING_DURATION = 60 * 60
+CO2_KG_PER_KM_DIRECT = 0.115
+CO2_KG_PER_KM_CONNECTING = 0.13
+# How long an OpenSky arrivals snapshot counts as fresh
+ARRIVALS_TTL = int(os.getenv("OPENSKY_ARRIVALS_TTL", str(15 * 60)))
 AIRPORT_DATA_FILE = str(Path(__file__).parent / "airport_data.json")
 OPENTRIPMAP_KEY = os.getenv("OPENTRIPMAP_KEY")
+# Name matches scoring below this fall through to the geocoder
+MIN_NAME_MATCH_SCORE = 0.5
+# Geocoder results are cached; misses and failures are remembered for a shorter time
+GEOCODE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL = int(os.getenv("GEOCODE_NEGATIVE_CACHE_TTL", str(3600)))
 
-def load_airport_data():
-    """Load airport data from JSON file"""
+class AirportIndex(NamedTuple):
+    """Immutable, array-backed view of the airport table.
+    Record i is (codes[i], names[i], cities[i], countries[i], lats[i], lons[i]).
+    """
+    mtime: float
+    codes: Tuple[str, ...]
+    names: Tuple[str, ...]
+    cities: Tuple[str, ...]
+    countries: Tuple[str, ...]
+    lats: array
+    lons: array
+    by_code: Mapping[str, int]
+    by_city: Mapping[str, Tuple[int, ...]]
+    by_name: Mapping[str, int]
+    geo: SphereKDTree
+    search: AirportSearchIndex
+
+    def record(self, i: int) -> Dict:
+        """Airport record in the same shape as airport_data.json."""
+        return {
+            "name": self.names[i],
+            "city": self.cities[i],
+            "country": self.countries[i],
+            "lat": self.lats[i],
+            "lon": self.lons[i],
+        }
+
+_index_lock = threading.Lock()
+_airport_index: Optional[AirportIndex] = None
+
+def _build_airport_index(airports: Dict, mtime: float) -> AirportIndex:
+    codes, names, cities, countries = [], [], [], []
+    lats, lons = array("d"), array("d")
+    by_code, by_city, by_name = {}, {}, {}
+    for code, data in airports.items():
+        i = len(codes)
+        codes.append(code)
+        names.append(data["name"])
+        cities.append(data["city"])
+        countries.append(data.get("country", ""))
+        lats.append(float(data["lat"]))
+        lons.append(float(data["lon"]))
+        by_code[code] = i
+        by_city.setdefault(normalize_text(data["city"]), []).append(i)
+        by_name.setdefault(normalize_text(data["name"]), i)
+    return AirportIndex(
+        mtime=mtime,
+        codes=tuple(codes),
+        names=tuple(names),
+        cities=tuple(cities),
+        countries=tuple(countries),
+        lats=lats,
+        lons=lons,
+        by_code=MappingProxyType(by_code),
+        by_city=MappingProxyType({k: tuple(v) for k, v in by_city.items()}),
+        by_name=MappingProxyType(by_name),
+        geo=SphereKDTree(lats, lons),
+        search=AirportSearchIndex(codes, names, cities, countries),
+    )
+
+def get_airport_index() -> AirportIndex:
+    """Return the process-wide airport index, rebuilding it when airport_data.json changes."""
+    global _airport_index
     try:
-        with open(AIRPORT_DATA_FILE, 'r') as f:
-            return json.load(f)
-    except Exception:
-        return {"airports": {}}
+        mtime = os.stat(AIRPORT_DATA_FILE).st_mtime
+    except OSError:
+        mtime = -1.0
+    index = _airport_index
+    if index is not None and index.mtime == mtime:
+        return index
+    with _index_lock:
+        if _airport_index is None or _airport_index.mtime != mtime:
+            try:
+                with open(AIRPORT_DATA_FILE, 'r') as f:
+                    airports = json.load(f).get("airports", {})
+            except Exception:
+                airports = {}
+            _airport_index = _build_airport_index(airports, mtime)
+        return _airport_index
 
-def geocode_city(name: str) -> Optional[Tuple[float, float]]:
-    """Geocode a city name to (lat, lon) using OpenTripMap's geoname endpoint.
-    Returns (lat, lon) or None.
-    """
-    if not OPENTRIPMAP_KEY or not name:
-        return None
+def load_airport_data():
+    """Load airport data in the airport_data.json shape (served from the in-memory index)"""
+    index = get_airport_index()
+    return {"airports": {code: index.record(i) for i, code in enumerate(index.codes)}}
+
+_geocode_cache = None
+_geocode_cache_lock = threading.Lock()
+_geocode_inflight = SingleFlight()
+
+def _get_geocode_cache():
+    global _geocode_cache
+    with _geocode_cache_lock:
+        if _geocode_cache is None:
+            _geocode_cache = open_tiered_cache("geocode.sqlite3", table="geocode", ttl=GEOCODE_TTL)
+        return _geocode_cache
+
+def _fetch_geoname(name: str) -> Optional[Tuple[float, float]]:
+    """Call OpenTripMap's geoname endpoint. Returns (lat, lon) or None."""
     try:
-        resp = requests.get(
-            "https://api.opentripmap.com/0.1/en/places/geoname",
+        # Shared keep-alive pool: repeated lookups skip the TCP/TLS handshake
+        resp = get_http_client().get(
+            f"{OPENTRIPMAP_API_BASE}/places/geoname",
             params={"name": name, "apikey": OPENTRIPMAP_KEY},
             timeout=8,
         )
@@ -45,18 +157,53 @@ def geocode_city(name: str) -> Optional[Tuple[float, float]]:
         return None
     return None
 
+def geocode_city(name: str) -> Optional[Tuple[float, float]]:
+    """Geocode a city name to (lat, lon) using OpenTripMap's geoname endpoint.
+    Answers are cached by normalized name (failures for a shorter time), and concurrent
+    lookups of the same name share a single outbound request.
+    Returns (lat, lon) or None.
+    """
+    key = normalize_text(name)
+    if not OPENTRIPMAP_KEY or not key:
+        return None
+
+    cache = _get_geocode_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return (cached["lat"], cached["lon"]) if cached["found"] else None
+
+    def lookup():
+        # Another caller may have filled the cache while we waited to lead
+        entry = cache.get(key)
+        if entry is None:
+            coords = _fetch_geoname(name)
+            if coords:
+                entry = {"found": True, "lat": coords[0], "lon": coords[1]}
+                cache.set(key, entry)
+            else:
+                entry = {"found": False}
+                cache.set(key, entry, ttl=GEOCODE_NEGATIVE_TTL)
+        return (entry["lat"], entry["lon"]) if entry["found"] else None
+
+    return _geocode_inflight.do(key, lookup)
+
+def nearest_airports(lat: float, lon: float, k: int = 5) -> List[Tuple[str, float]]:
+    """Return up to k (code, distance_km) pairs nearest to a coordinate, closest first."""
+    index = get_airport_index()
+    idx, dist = index.geo.query(lat, lon, k=k)
+    return [(index.codes[i], round(float(d), 1)) for i, d in zip(idx, dist)]
+
+def airports_within(lat: float, lon: float, radius_km: float) -> List[Tuple[str, float]]:
+    """Return (code, distance_km) pairs for every airport within radius_km, closest first."""
+    index = get_airport_index()
+    idx, dist = index.geo.query_radius(lat, lon, radius_km)
+    return [(index.codes[i], round(float(d), 1)) for i, d in zip(idx, dist)]
+
 def nearest_airport(lat: float, lon: float) -> Optional[str]:
     """Find the nearest airport in our database to a given coordinate."""
-    airports = load_airport_data().get("airports", {})
-    best = None
-    best_d = float("inf")
-    for code, data in airports.items():
-        d = calculate_distance(lat, lon, data["lat"], data["lon"])
-        if d < best_d:
-            best_d = d
-            best = code
     # No hard threshold to maximize match likelihood; callers can choose to accept.
-    return best
+    nearest = nearest_airports(lat, lon, k=1)
+    return nearest[0][0] if nearest else None
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """Calculate distance between two points using Haversine formula"""
@@ -72,29 +219,51 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
 
 def get_flight_price_estimate(distance: float) -> float:
     """Estimate flight price based on distance"""
-    base_price = 50
-    price_per_km = 0.15
-    return round(base_price + (distance * price_per_km), 2)
+    return round(BASE_FARE + (distance * FARE_PER_KM), 2)
+
+def search_airports(query: str, limit: int = 5) -> List[Tuple[str, float]]:
+    """Return ranked (code, score) candidates for a city, airport or country name."""
+    return get_airport_index().search.search(query, limit=limit)
+
+def _exact_airport(index: AirportIndex, query: str) -> Optional[str]:
+    """Code of an airport whose city or name is exactly the query's place part and, when the query
+    names a country after a comma, that is in that country; None if nothing matches exactly."""
+    head, _, rest = query.partition(",")
+    place, country = normalize_text(head), normalize_text(rest)
+    matches = index.by_city.get(place, ())
+    if place in index.by_name:
+        matches += (index.by_name[place],)
+    if not matches:
+        return None
+    if country:
+        # "London, Ontario" is not London, UK: leave it to the fuzzy search and the geocoder
+        in_country = [i for i in matches if normalize_text(index.countries[i]) == country]
+        return index.codes[in_country[0]] if in_country else None
+    return index.codes[matches[0]]
 
 def get_airport_code(city: str) -> Optional[str]:
     """Get IATA airport code from a city/airport name or direct code input.
     Fallback: geocode city and pick nearest known airport.
     """
-    airports = load_airport_data()
+    index = get_airport_index()
     s = (city or "").strip()
     if not s:
         return None
 
     # If user provided a 3-letter IATA code directly, accept it if we know it
     code_candidate = s.upper()
-    if len(code_candidate) == 3 and code_candidate in airports.get("airports", {}):
+    if len(code_candidate) == 3 and code_candidate in index.by_code:
         return code_candidate
 
-    # Otherwise try to match by city or airport name
-    s_low = s.lower()
-    for code, data in airports.get("airports", {}).items():
-        if s_low in data["city"].lower() or s_low in data["name"].lower():
-            return code
+    # Exact city or airport name, optionally qualified by country ("Paris, France")
+    exact = _exact_airport(index, s)
+    if exact:
+        return exact
+
+    # Otherwise take the best ranked city/airport name match
+    matches = index.search.search(s, limit=1, min_score=MIN_NAME_MATCH_SCORE)
+    if matches:
+        return matches[0][0]
 
     # Fallback: geocode and choose nearest known airport
     coords = geocode_city(s)
@@ -103,49 +272,105 @@ def get_airport_code(city: str) -> Optional[str]:
         return nearest_airport(lat, lon)
     return None
 
-def search_flights(origin_code: str, destination_code: str, max_results: int = 5) -> Dict:
-    """
-    Search for flights using OpenSky Network API
-    Returns estimated flight options based on real flight data
-    """
-    airports = load_airport_data()
-    
-    # Validate airport codes
-    if origin_code not in airports["airports"] or destination_code not in airports["airports"]:
-        return {"flights": [], "error": "Airport not found"}
-
-    origin = airports["airports"][origin_code]
-    dest = airports["airports"][destination_code]
-
-    # Calculate distance
-    distance = calculate_distance(
-        origin["lat"], origin["lon"],
-        dest["lat"], dest["lon"]
-    )
+_arrivals: Dict[str, Tuple[float, int]] = {}
+_arrivals_pending = set()
+_arrivals_lock = threading.Lock()
+_arrivals_queue = queue.Queue()
+_arrivals_worker = None
 
-    # Try to hit OpenSky for recency signal (non-blocking for UX)
+def _fetch_arrivals(airport_code: str) -> Optional[int]:
+    """Count OpenSky arrivals at an airport over the last 2 hours. Returns None on failure."""
     try:
         params = {
-            "airport": destination_code,
+            "airport": airport_code,
             "begin": int((datetime.now() - timedelta(hours=2)).timestamp()),
             "end": int(datetime.now().timestamp())
         }
-        _ = requests.get(f"{OPENSKY_API_BASE}/flights/arrival", params=params, timeout=6)
-        # We intentionally ignore the result; if it fails, we'll still show estimates.
+        resp = get_http_client().get(f"{OPENSKY_API_BASE}/flights/arrival", params=params, timeout=6)
+        if resp.status_code == 404:
+            # OpenSky answers 404 when there were no flights in the window
+            return 0
+        resp.raise_for_status()
+        data = resp.json()
+        return len(data) if isinstance(data, list) else None
     except Exception:
-        pass
+        return None
 
-    # Always generate a set of reasonable options so the UI shows flights
+def _arrivals_refresh_loop():
+    while True:
+        code = _arrivals_queue.get()
+        count = _fetch_arrivals(code)
+        with _arrivals_lock:
+            _arrivals_pending.discard(code)
+            if count is not None:
+                _arrivals[code] = (time.time(), count)
+
+def request_arrivals_refresh(airport_code: str):
+    """Queue a background OpenSky refresh for an airport unless fresh data is cached or one is pending."""
+    global _arrivals_worker
+    with _arrivals_lock:
+        cached = _arrivals.get(airport_code)
+        if cached and time.time() - cached[0] < ARRIVALS_TTL:
+            return
+        if airport_code in _arrivals_pending:
+            return
+        _arrivals_pending.add(airport_code)
+        if _arrivals_worker is None:
+            _arrivals_worker = threading.Thread(target=_arrivals_refresh_loop, name="opensky-refresh", daemon=True)
+            _arrivals_worker.start()
+    _arrivals_queue.put(airport_code)
+
+def get_recent_arrivals(airport_code: str) -> Optional[int]:
+    """Return the cached count of recent arrivals at an airport, or None if nothing fresh is cached."""
+    with _arrivals_lock:
+        cached = _arrivals.get(airport_code)
+    if cached and time.time() - cached[0] < ARRIVALS_TTL:
+        return cached[1]
+    return None
+
+class Route(NamedTuple):
+    """Precomputed estimates for an origin/destination pair."""
+    distance: float
+    base_price: float
+    direct_duration: int
+    connecting_duration: int
+    co2_direct: float
+    co2_connecting: float
+
+@lru_cache(maxsize=4096)
+def _route(origin_code: str, destination_code: str, index_mtime: float) -> Route:
+    # index_mtime is part of the key so a reloaded airport table invalidates cached routes
+    index = get_airport_index()
+    o, d = index.by_code[origin_code], index.by_code[destination_code]
+    distance = calculate_distance(index.lats[o], index.lons[o], index.lats[d], index.lons[d])
+    return Route(
+        distance=distance,
+        base_price=get_flight_price_estimate(distance),
+        direct_duration=max(MIN_DIRECT_DURATION, int((distance / DIRECT_SPEED_KMH) * 3600)),
+        connecting_duration=max(MIN_CONNECTING_DURATION, int((distance / CONNECTING_SPEED_KMH) * 3600)),
+        co2_direct=round(distance * CO2_KG_PER_KM_DIRECT, 1),
+        co2_connecting=round(distance * CO2_KG_PER_KM_CONNECTING, 1),
+    )
+
+def get_route(origin_code: str, destination_code: str) -> Route:
+    """Return the memoized Route for two known airport codes (KeyError if either is unknown)."""
+    return _route(origin_code, destination_code, get_airport_index().mtime)
+
+@lru_cache(maxsize=1024)
+def _route_flights(origin_code: str, destination_code: str, max_results: int, day: str, index_mtime: float) -> Tuple[Dict, ...]:
+    """Estimated flight options for a route, memoized per departure day (day is YYYY-MM-DD)."""
     flights = []
-    base_price = get_flight_price_estimate(distance)
+    route = get_route(origin_code, destination_code)
+    base_price = route.base_price
+    today = datetime.strptime(day, "%Y-%m-%d")
 
     # Direct flights
     for i in range(min(max_results, 3)):
         price_variation = 0.9 + ((i * 2) / 10)
         price = round(base_price * price_variation, 2)
-        duration = max(45*60, int((distance / 800) * 3600))  # min 45 minutes
-        departure = (datetime.now() + timedelta(days=i + 1)).strftime("%Y-%m-%d")
-        co2 = round(distance * 0.115, 1)
+        duration = route.direct_duration
+        departure = (today + timedelta(days=i + 1)).strftime("%Y-%m-%d")
+        co2 = route.co2_direct
         flights.append({
             "price": price,
             "airlines": ["Direct"],
@@ -161,9 +386,9 @@ def search_flights(origin_code: str, destination_code: str, max_results: int = 5
     for i in range(max(0, min(add_connecting, 2))):
         price_variation = 1.1 + ((i * 2) / 10)
         price = round(base_price * price_variation, 2)
-        duration = max(60*60, int((distance / 600) * 3600))  # longer due to layover
-        departure = (datetime.now() + timedelta(days=i + 2)).strftime("%Y-%m-%d")
-        co2 = round(distance * 0.13, 1)
+        duration = route.connecting_duration
+        departure = (today + timedelta(days=i + 2)).strftime("%Y-%m-%d")
+        co2 = route.co2_connecting
         flights.append({
             "price": price,
             "airlines": ["Connecting"],
@@ -174,7 +399,68 @@ def search_flights(origin_code: str, destination_code: str, max_results: int = 5
             "stops": 1
         })
 
+    return tuple(flights)
+
+def search_flights(origin_code: str, destination_code: str, max_results: int = 5) -> Dict:
+    """
+    Search for flights using OpenSky Network API
+    Returns estimated flight options based on real flight data.
+    OpenSky arrival counts are gathered in the background and included once cached.
+    Options for a route are memoized per day, so hot routes skip the distance math and formatting.
+    """
+    index = get_airport_index()
+
+    # Validate airport codes
+    if origin_code not in index.by_code or destination_code not in index.by_code:
+        return {"flights": [], "error": "Airport not found"}
+
+    # OpenSky recency signal comes from the background refresher; never wait on it here
+    recent_arrivals = get_recent_arrivals(destination_code)
+    request_arrivals_refresh(destination_code)
+
+    # Always generate a set of reasonable options so the UI shows flights
+    cached = _route_flights(origin_code, destination_code, max_results, datetime.now().strftime("%Y-%m-%d"), index.mtime)
+    # Hand out copies so callers can't modify the memoized options
+    flights = [dict(f, airlines=list(f["airlines"])) for f in cached]
+
     return {
         "flights": flights,
-        "currency": "USD"
-    }
\ No newline at end of file
+        "currency": "USD",
+        # Arrivals at the destination in the last 2 hours (None until OpenSky data is cached)
+        "recent_arrivals": recent_arrivals
+    }
+
+def search_flights_matrix(origins: List[str], destinations: List[str]) -> Dict:
+    """
+    Estimate flights for every origin/destination pair at once.
+    Returns a columnar result: the resolved 'origins' and 'destinations' code lists plus
+    (len(origins), len(destinations)) NumPy arrays for distance, cheapest direct fare,
+    direct/connecting durations in seconds and CO2. Codes missing from the airport
+    table are dropped and listed under 'missing'.
+    """
+    index = get_airport_index()
+    origin_codes = [c for c in origins if c in index.by_code]
+    dest_codes = [c for c in destinations if c in index.by_code]
+    missing = sorted({c for c in list(origins) + list(destinations) if c not in index.by_code})
+
+    lats = np.frombuffer(index.lats, dtype=np.float64)
+    lons = np.frombuffer(index.lons, dtype=np.float64)
+    o = np.fromiter((index.by_code[c] for c in origin_codes), dtype=np.int64, count=len(origin_codes))
+    d = np.fromiter((index.by_code[c] for c in dest_codes), dtype=np.int64, count=len(dest_codes))
+
+    distance = haversine_km(lats[o][:, None], lons[o][:, None], lats[d][None, :], lons[d][None, :])
+    base_price = np.round(BASE_FARE + distance * FARE_PER_KM, 2)
+
+    return {
+        "origins": origin_codes,
+        "destinations": dest_codes,
+        "distance_km": distance,
+        # Cheapest direct option from search_flights (may differ by a cent from float rounding)
+        "price": np.round(base_price * 0.9, 2),
+        "direct_duration": np.maximum(MIN_DIRECT_DURATION, (distance / DIRECT_SPEED_KMH * 3600).astype(np.int64)),
+        "connecting_duration": np.maximum(MIN_CONNECTING_DURATION, (distance / CONNECTING_SPEED_KMH * 3600).astype(np.int64)),
+        "co2_kg": np.round(distance * CO2_KG_PER_KM_DIRECT, 1),
+        "co2_kg_connecting": np.round(distance * CO2_KG_PER_KM_CONNECTING, 1),
+        "currency": "USD",
+        "missing": missing,
+    }
@@ -0,0 +1,145 @@
+"""Spatial index for nearest-airport lookups.
+Points are stored as unit vectors on the sphere in a static k-d tree. Straight-line (chord)
+distance between unit vectors grows monotonically with great-circle distance, so Euclidean
+pruning in 3D gives exact k-nearest and within-radius answers on the sphere.
+"""
+from typing import Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorized haversine distance in km; arguments broadcast like NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def to_unit_xyz(lats, lons) -> np.ndarray:
+    """Convert degrees of latitude/longitude to an (N, 3) array of unit vectors."""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _chord_to_km(chord: np.ndarray) -> np.ndarray:
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0.0, 1.0))
+
+
+def _km_to_chord(km: float) -> float:
+    theta = min(max(km, 0.0) / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(theta / 2)
+
+
+class SphereKDTree:
+    """Static k-d tree over points on the Earth's surface.
+    query() returns the k nearest points and query_radius() every point within a radius,
+    both as (indices, distances_km) sorted by distance. Indices refer to the input order.
+    """
+
+    def __init__(self, lats, lons, leaf_size: int = 32):
+        self.xyz = to_unit_xyz(lats, lons).reshape(-1, 3)
+        self.size = len(self.xyz)
+        self.leaf_size = max(1, leaf_size)
+        self.order = np.arange(self.size)
+        # Flat node arrays: item range, bounding box and children (-1 for leaves)
+        self._start, self._end, self._left, self._right = [], [], [], []
+        self._lo, self._hi = [], []
+        if self.size:
+            self._build()
+        self._lo = np.array(self._lo).reshape(-1, 3)
+        self._hi = np.array(self._hi).reshape(-1, 3)
+
+    def _new_node(self, start: int, end: int) -> int:
+        pts = self.xyz[self.order[start:end]]
+        self._start.append(start)
+        self._end.append(end)
+        self._left.append(-1)
+        self._right.append(-1)
+        self._lo.append(pts.min(axis=0))
+        self._hi.append(pts.max(axis=0))
+        return len(self._start) - 1
+
+    def _build(self):
+        stack = [self._new_node(0, self.size)]
+        while stack:
+            node = stack.pop()
+            start, end = self._start[node], self._end[node]
+            if end - start <= self.leaf_size:
+                continue
+            axis = int(np.argmax(self._hi[node] - self._lo[node]))
+            mid = (start + end) // 2
+            segment = self.order[start:end]
+            part = np.argpartition(self.xyz[segment, axis], mid - start)
+            self.order[start:end] = segment[part]
+            self._left[node] = self._new_node(start, mid)
+            self._right[node] = self._new_node(mid, end)
+            stack.extend((self._left[node], self._right[node]))
+
+    def _box_distance(self, node: int, point: np.ndarray) -> float:
+        gap = np.maximum(self._lo[node] - point, 0.0) + np.maximum(point - self._hi[node], 0.0)
+        return float(np.sqrt(gap @ gap))
+
+    def query(self, lat: float, lon: float, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the k nearest points to (lat, lon)."""
+        k = min(k, self.size)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        point = to_unit_xyz(lat, lon)
+        best_idx = np.empty(0, dtype=np.int64)
+        best_d = np.empty(0)
+        bound = np.inf
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, point) > bound:
+                continue
+            left, right = self._left[node], self._right[node]
+            if left < 0:
+                idx = self.order[self._start[node]:self._end[node]]
+                d = np.linalg.norm(self.xyz[idx] - point, axis=1)
+                best_idx = np.concatenate([best_idx, idx])
+                best_d = np.concatenate([best_d, d])
+                if len(best_d) > k:
+                    keep = np.argpartition(best_d, k - 1)[:k]
+                    best_idx, best_d = best_idx[keep], best_d[keep]
+                if len(best_d) == k:
+                    bound = float(best_d.max())
+                continue
+            # Visit the nearer child first so the bound tightens early
+            if self._box_distance(left, point) <= self._box_distance(right, point):
+                stack.extend((right, left))
+            else:
+                stack.extend((left, right))
+        ranked = np.argsort(best_d, kind="stable")
+        return best_idx[ranked], _chord_to_km(best_d[ranked])
+
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Return every point within radius_km of (lat, lon)."""
+        if not self.size:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        point = to_unit_xyz(lat, lon)
+        limit = _km_to_chord(radius_km)
+        found_idx, found_d = [], []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, point) > limit:
+                continue
+            if self._left[node] < 0:
+                idx = self.order[self._start[node]:self._end[node]]
+                d = np.linalg.norm(self.xyz[idx] - point, axis=1)
+                mask = d <= limit
+                found_idx.append(idx[mask])
+                found_d.append(d[mask])
+                continue
+            stack.extend((self._left[node], self._right[node]))
+        if not found_idx:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        idx = np.concatenate(found_idx)
+        d = np.concatenate(found_d)
+        ranked = np.argsort(d, kind="stable")
+        return idx[ranked], _chord_to_km(d[ranked])
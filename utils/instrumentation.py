@@ -0,0 +1,90 @@
+"""Per-step instrumentation for the crew pipeline.
+Step metrics (wall/queue time, prompt/completion tokens, retries, cache hits) are attached to the
+plan events and passed to any registered listeners. When OpenTelemetry is installed, each step
+also runs inside a span carrying the same attributes; without it the span helpers are no-ops.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List
+
+try:
+    from opentelemetry import trace as _otel_trace
+    _tracer = _otel_trace.get_tracer("trip_planner")
+except ImportError:
+    _tracer = None
+
+_listeners: List[Callable[[Dict], None]] = []
+_listeners_lock = threading.Lock()
+
+
+def add_metrics_listener(listener: Callable[[Dict], None]):
+    """Call listener(metrics) whenever a step finishes."""
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_metrics_listener(listener: Callable[[Dict], None]):
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def notify_step_metrics(metrics: Dict):
+    """Pass finished-step metrics to every listener; a failing listener never breaks a plan."""
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener(metrics)
+        except Exception:
+            pass
+
+
+@contextmanager
+def step_span(name: str, **attributes):
+    """OpenTelemetry span around a step (no-op without OpenTelemetry). Yields a dict whose
+    entries are set as span attributes when the block exits."""
+    extra = {}
+    if _tracer is None:
+        yield extra
+        return
+    with _tracer.start_as_current_span(name) as span:
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
+        try:
+            yield extra
+        finally:
+            for key, value in extra.items():
+                if isinstance(value, (bool, int, float, str)):
+                    span.set_attribute(key, value)
+
+
+def agent_token_usage(agent) -> Dict[str, int]:
+    """Running prompt/completion token totals of one CrewAI agent. Each LLM call the agent makes adds
+    to its own counter as it returns, so the difference across a call made while the agent is checked
+    out is that call's usage. A kickoff result's token_usage can't be used: it sums over the shared LLM
+    and every earlier use of a pooled agent."""
+    process = getattr(agent, "_token_process", None)
+    usage = process.get_summary() if process is not None else None
+    return {
+        "prompt_tokens": int(getattr(usage, "prompt_tokens", 0) or 0),
+        "completion_tokens": int(getattr(usage, "completion_tokens", 0) or 0),
+    }
+
+
+def summarize_metrics(steps: Iterable[Dict]) -> Dict:
+    """Aggregate per-step metrics into totals for a plan or a session."""
+    steps = list(steps)
+    return {
+        "steps": len(steps),
+        "wall_time_s": round(sum(m.get("wall_time_s", 0.0) for m in steps), 3),
+        "queue_time_s": round(sum(m.get("queue_time_s", 0.0) for m in steps), 3),
+        "rate_limit_wait_s": round(sum(m.get("rate_limit_wait_s", 0.0) for m in steps), 3),
+        "prompt_tokens": sum(m.get("prompt_tokens", 0) for m in steps),
+        "completion_tokens": sum(m.get("completion_tokens", 0) for m in steps),
+        "retries": sum(m.get("retries", 0) for m in steps),
+        "cache_hits": sum(1 for m in steps if m.get("cache_hit")),
+        "prefetch_hits": sum(1 for m in steps if m.get("prefetched")),
+        "reuse_hits": sum(1 for m in steps if m.get("reused")),
+        "failures": sum(1 for m in steps if m.get("failed")),
+    }
@@ -0,0 +1,128 @@
+"""Process-wide registry of LLM clients.
+One pooled keep-alive HTTP client is shared by the crew LLMs and the travel API lookups,
+so concurrent Streamlit sessions reuse connections instead of paying a TLS handshake per request.
+Coroutines get a pooled httpx.AsyncClient (HTTP/2 when the h2 package is installed) per event loop;
+run_sync() runs them for synchronous callers on one background loop, so those share a pool too.
+"""
+import asyncio
+import importlib.util
+import os
+import threading
+import weakref
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Overridable so the app can be pointed at a local OpenAI-compatible server (see benchmarks/)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+HF_ROUTER_BASE_URL = os.getenv("HF_ROUTER_BASE_URL", "https://router.huggingface.co/v1")
+
+_lock = threading.Lock()
+_http_client = None
+_crew_llms = {}
+# An AsyncClient's connections belong to the loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+_io_loop = None
+
+HTTP_LIMITS = dict(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60)
+# HTTP/2 multiplexes concurrent requests to a provider over one connection; it needs the h2 package
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+def get_http_client() -> httpx.Client:
+    """Shared keep-alive HTTP client (thread-safe, connection pooled)."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(**HTTP_LIMITS),
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                http2=HTTP2,
+            )
+            try:
+                # CrewAI routes completions through litellm; point it at the same pool
+                import litellm
+                litellm.client_session = _http_client
+            except ImportError:
+                pass
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive async HTTP client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(**HTTP_LIMITS),
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                http2=HTTP2,
+            )
+            _async_clients[loop] = client
+        return client
+
+
+def _get_io_loop() -> asyncio.AbstractEventLoop:
+    global _io_loop
+    with _lock:
+        if _io_loop is None:
+            _io_loop = asyncio.new_event_loop()
+            threading.Thread(target=_io_loop.run_forever, name="llm-io", daemon=True).start()
+        return _io_loop
+
+
+def run_sync(coro, timeout: float = None):
+    """Run a coroutine from synchronous code on the shared background loop and return its result.
+    Blocking threads wait here while the loop interleaves their requests."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_io_loop()).result(timeout)
+
+
+def get_openrouter_api_key() -> Optional[str]:
+    """Read the OpenRouter key from the environment, falling back to Streamlit secrets."""
+    # Try environment variable first (works in HuggingFace and locally)
+    api_key = os.getenv("OPENROUTER_API_KEY")
+
+    # Try Streamlit secrets (for Streamlit Cloud)
+    if not api_key:
+        try:
+            import streamlit as st
+            api_key = st.secrets.get("OPENROUTER_API_KEY")
+        except Exception:
+            pass
+    return api_key
+
+
+def get_crew_llm(model: str, api_key: str, temperature: float):
+    """Return the cached chat model used by the crew agents.
+    Uses CrewAI's native LLM with streaming enabled when available, so tokens can be
+    forwarded to the UI as they arrive; older CrewAI releases get a LangChain ChatOpenAI.
+    """
+    http_client = get_http_client()
+    key = (model, api_key, temperature)
+    with _lock:
+        llm = _crew_llms.get(key)
+        if llm is None:
+            try:
+                from crewai import LLM
+                llm = LLM(
+                    model=model,
+                    api_key=api_key,
+                    base_url=OPENROUTER_BASE_URL,
+                    temperature=temperature,
+                    stream=True,
+                )
+            except ImportError:
+                from langchain_openai import ChatOpenAI
+                llm = ChatOpenAI(
+                    model=model,
+                    openai_api_key=api_key,
+                    openai_api_base=OPENROUTER_BASE_URL,
+                    temperature=temperature,
+                    http_client=http_client,
+                )
+            _crew_llms[key] = llm
+        return llm
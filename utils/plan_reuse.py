@@ -0,0 +1,244 @@
+"""Similarity-based reuse of earlier plan step outputs.
+Trip specs are normalized ("Paris, 5 days, food and museums" and "paris 5 days museums & food" give
+the same features), and every generated step output is indexed under
+  - a partition of the inputs that must match exactly for that step (destination, and e.g. days or
+    people when the step depends on them), and
+  - a MinHash signature of the fuzzy inputs (preference words, the rest of the destination),
+    banded for locality-sensitive hashing.
+Lookups fetch only the rows that share an LSH band with the query through an indexed SQLite table,
+then rank them by exact Jaccard similarity, so their cost does not grow with the corpus.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.airport_search import normalize_text
+from utils.cache import CACHE_DIR
+
+# Jaccard similarity of the fuzzy features needed to reuse a stored step output
+REUSE_THRESHOLD = float(os.getenv("PLAN_REUSE_THRESHOLD", "0.8"))
+REUSE_TTL = int(os.getenv("PLAN_REUSE_TTL", str(30 * 24 * 3600)))
+NUM_PERM = 32
+BANDS = 8  # 4 rows per band: pairs above ~0.6 similarity almost always share a band
+# Inputs compared fuzzily; every other input of a step must match exactly
+FUZZY_FIELDS = ("preferences",)
+
+_STOPWORDS = frozenset(
+    "a an and any at by for from in into of on or the to with trip travel travelling traveling "
+    "day days week weeks some lots lot very".split()
+)
+_MERSENNE_61 = (1 << 61) - 1
+_rng = np.random.RandomState(2024)
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalize_words(text: str, stem: bool = True) -> FrozenSet[str]:
+    """Accent-folded, lower-cased content words of free text (stemmed unless stem=False);
+    order and connectives don't matter."""
+    words = normalize_text(str(text or "").replace("&", " ")).split()
+    return frozenset(_stem(w) if stem else w for w in words if w not in _STOPWORDS)
+
+
+def normalize_place(place: str) -> Tuple[str, FrozenSet[str]]:
+    """(head, qualifiers) for a place: "Paris, France" -> ("paris", {"france"})."""
+    head, _, rest = str(place or "").partition(",")
+    return " ".join(sorted(normalize_words(head, stem=False))), normalize_words(rest, stem=False)
+
+
+def normalize_budget(budget) -> str:
+    """Amount and currency words of a budget string: "$2,000 USD" -> "2000 usd"."""
+    text = str(budget or "").lower().replace(",", "")
+    amounts = re.findall(r"\d+(?:\.\d+)?", text)
+    words = sorted(normalize_words(re.sub(r"[\d.]+", " ", text)) | ({"usd"} if "$" in text else set()))
+    return " ".join(([str(float(amounts[0]))] if amounts else []) + words)
+
+
+def trip_features(trip: Dict, inputs: Sequence[str]) -> Tuple[str, FrozenSet[str]]:
+    """(partition, fuzzy features) of the trip inputs a step depends on."""
+    exact = []
+    fuzzy = set()
+    for field in inputs:
+        value = trip.get(field)
+        if field in FUZZY_FIELDS:
+            words = normalize_words(value)
+            fuzzy |= {f"{field}:{w}" for w in words} or {f"{field}:-"}
+        elif field in ("origin", "destination"):
+            head, qualifiers = normalize_place(value)
+            exact.append(f"{field}={head}")
+            fuzzy |= {f"{field}:{w}" for w in qualifiers}
+        elif field == "budget":
+            exact.append(f"budget={normalize_budget(value)}")
+        else:
+            exact.append(f"{field}={str(value).strip().lower()}")
+    return "|".join(exact), frozenset(fuzzy)
+
+
+def minhash(features: Iterable[str]) -> np.ndarray:
+    """NUM_PERM-value MinHash signature of a feature set."""
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=4).digest(), "big") for f in features] or [0],
+        dtype=np.uint64,
+    )
+    # (a*x + b) mod p for every permutation/feature pair; all operands stay below 2**63
+    return ((np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_61).min(axis=1)
+
+
+def band_keys(namespace: str, step: int, partition: str, signature: np.ndarray) -> Tuple[int, ...]:
+    """Signed 64-bit keys, one per LSH band, scoped to the step and partition."""
+    rows = NUM_PERM // BANDS
+    prefix = f"{namespace}\x00{step}\x00{partition}\x00".encode("utf-8")
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(prefix + bytes([band]) + signature[band * rows:(band + 1) * rows].tobytes(),
+                                 digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return tuple(keys)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class PlanReuseIndex:
+    """SQLite-backed MinHash-LSH index of step outputs."""
+
+    def __init__(self, path: str, ttl: int = REUSE_TTL, max_candidates: int = 64):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_candidates = max_candidates
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS step_outputs ("
+            "id INTEGER PRIMARY KEY, namespace TEXT NOT NULL, step INTEGER NOT NULL, partition_key TEXT NOT NULL, "
+            "features TEXT NOT NULL, text TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS step_bands (band_key INTEGER NOT NULL, output_id INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS step_bands_key ON step_bands (band_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS step_outputs_created ON step_outputs (created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS step_outputs_partition ON step_outputs (partition_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS step_bands_output ON step_bands (output_id)")
+
+    def add(self, namespace: str, step: int, trip: Dict, inputs: Sequence[str], text: str):
+        """Index a freshly generated step output."""
+        partition, features = trip_features(trip, inputs)
+        keys = band_keys(namespace, step, partition, minhash(features))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT INTO step_outputs (namespace, step, partition_key, features, text, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (namespace, step, partition, json.dumps(sorted(features)), text, time.time()),
+                )
+                self._conn.executemany(
+                    "INSERT INTO step_bands (band_key, output_id) VALUES (?, ?)",
+                    [(key, cursor.lastrowid) for key in keys],
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def lookup(self, namespace: str, step: int, trip: Dict, inputs: Sequence[str],
+               threshold: float = REUSE_THRESHOLD, max_age: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """(text, similarity) of the most similar stored output at or above threshold, or None.
+        max_age (seconds, capped at the index TTL) skips older outputs."""
+        partition, features = trip_features(trip, inputs)
+        keys = band_keys(namespace, step, partition, minhash(features))
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT o.id, o.partition_key, o.features FROM step_outputs o "
+                f"WHERE o.id IN (SELECT output_id FROM step_bands WHERE band_key IN ({placeholders})) "
+                f"AND o.created_at >= ? ORDER BY o.id DESC LIMIT ?",
+                (*keys, time.time() - min(self.ttl, max_age or self.ttl), self.max_candidates),
+            ).fetchall()
+        best_id, best_score = None, -1.0
+        for row_id, row_partition, row_features in rows:
+            if row_partition != partition:
+                continue  # 64-bit band collision across partitions
+            score = jaccard(features, frozenset(json.loads(row_features)))
+            if score > best_score:
+                best_id, best_score = row_id, score
+        if best_id is None or best_score < threshold:
+            self.misses += 1
+            return None
+        with self._lock:
+            text = self._conn.execute("SELECT text FROM step_outputs WHERE id = ?", (best_id,)).fetchone()[0]
+        self.hits += 1
+        return text, round(best_score, 3)
+
+    def delete(self, namespace: str, step: int, trip: Dict, inputs: Sequence[str]) -> int:
+        """Drop every stored output of a step whose exact inputs match the trip's, regardless of how
+        similar the fuzzy ones are. Returns how many were dropped."""
+        partition, _ = trip_features(trip, inputs)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [(row[0],) for row in self._conn.execute(
+                    "SELECT id FROM step_outputs WHERE partition_key = ? AND namespace = ? AND step = ?",
+                    (partition, namespace, step),
+                )]
+                self._conn.executemany("DELETE FROM step_bands WHERE output_id = ?", ids)
+                self._conn.executemany("DELETE FROM step_outputs WHERE id = ?", ids)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return len(ids)
+
+    def purge(self):
+        """Drop outputs older than the TTL."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM step_bands WHERE output_id IN (SELECT id FROM step_outputs WHERE created_at < ?)", (cutoff,)
+            )
+            self._conn.execute("DELETE FROM step_outputs WHERE created_at < ?", (cutoff,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM step_outputs").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_plan_reuse_index() -> Optional[PlanReuseIndex]:
+    """Process-wide reuse index, or None if disabled (PLAN_REUSE=off) or the cache dir isn't writable."""
+    global _index
+    if os.getenv("PLAN_REUSE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = PlanReuseIndex(CACHE_DIR / "plan_reuse.sqlite3")
+                _index.purge()
+            except (OSError, sqlite3.Error):
+                return None
+        return _index
@@ -0,0 +1,312 @@
+"""Shared rate limiting and retry scheduling for LLM providers.
+Each provider gets an adaptive token bucket (requests per second) and a cap on concurrent calls.
+call_with_retry() runs a request inside those limits and retries throttling and transient
+failures with jittered exponential backoff, honoring Retry-After when the server sends one.
+async_call_with_retry() does the same for coroutines without blocking the event loop; both count
+against the same per-provider limits.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+# Per-provider defaults; override with <PROVIDER>_RPS / <PROVIDER>_MAX_CONCURRENCY env vars
+PROVIDER_DEFAULTS = {
+    "openrouter": {"rps": 2.0, "max_concurrency": 8},
+    "huggingface": {"rps": 1.0, "max_concurrency": 4},
+}
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = ("Timeout", "Connect", "RemoteProtocol", "RateLimit", "ServiceUnavailable", "InternalServer",
+                    "Overloaded")
+
+
+class TokenBucket:
+    """Token bucket whose refill rate backs off on throttling and recovers on success (AIMD)."""
+
+    def __init__(self, rate: float, capacity: float = None, min_rate: float = None):
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self) -> float:
+        """Take a token if one is available (returns 0), else return the seconds until one is."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> float:
+        """Block until a token is available. Returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self) -> float:
+        """acquire() for coroutines: waits without blocking the event loop."""
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class ProviderLimiter:
+    """Token bucket plus concurrency cap for one provider, with queue and wait-time metrics."""
+
+    def __init__(self, name: str, rps: float, max_concurrency: int):
+        self.name = name
+        self.bucket = TokenBucket(rps)
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @contextmanager
+    def slot(self):
+        """Hold a concurrency slot and a rate token for the duration of one request.
+        Yields the seconds spent waiting for them."""
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        self._slots.acquire()
+        try:
+            self.bucket.acquire()
+            waited = time.monotonic() - started
+            self._started(waited)
+        except BaseException:
+            with self._lock:
+                self.waiting -= 1
+            self._slots.release()
+            raise
+        try:
+            yield waited
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """slot() for coroutines. The concurrency cap is shared with threaded callers, so a free
+        slot is polled for rather than awaited."""
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            poll = 0.005
+            while not self._slots.acquire(blocking=False):
+                await asyncio.sleep(poll)
+                poll = min(poll * 2, 0.1)
+        except BaseException:
+            with self._lock:
+                self.waiting -= 1
+            raise
+        try:
+            await self.bucket.acquire_async()
+            waited = time.monotonic() - started
+            self._started(waited)
+        except BaseException:
+            with self._lock:
+                self.waiting -= 1
+            self._slots.release()
+            raise
+        try:
+            yield waited
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _started(self, waited: float):
+        with self._lock:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.calls += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def record(self, counter: str):
+        """Increment one of the retries/throttled/failures counters."""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "queue_depth": self.waiting,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "failures": self.failures,
+                "avg_wait_s": round(self.total_wait / self.calls, 3) if self.calls else 0.0,
+                "max_wait_s": round(self.max_wait, 3),
+                "current_rps": round(self.bucket.rate, 3),
+            }
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    """Process-wide limiter for a provider, created from defaults and env overrides."""
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            defaults = PROVIDER_DEFAULTS.get(provider, {"rps": 1.0, "max_concurrency": 4})
+            prefix = provider.upper().replace("-", "_")
+            limiter = ProviderLimiter(
+                provider,
+                rps=float(os.getenv(f"{prefix}_RPS", defaults["rps"])),
+                max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", defaults["max_concurrency"])),
+            )
+            _limiters[provider] = limiter
+        return limiter
+
+
+def limiter_metrics() -> Dict[str, Dict]:
+    """Metrics for every provider limiter created so far."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.metrics() for limiter in limiters}
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After header on the error's response, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(name in type(exc).__name__ for name in _RETRYABLE_NAMES)
+
+
+def _retry_delay(limiter: ProviderLimiter, exc: Exception, attempt: int, max_attempts: int, base_delay: float,
+                 max_delay: float) -> Optional[float]:
+    """Seconds to wait before retrying a failed attempt, or None if it should not be retried."""
+    status = _status_code(exc)
+    if status == 429:
+        limiter.bucket.throttled()
+        limiter.record("throttled")
+    if attempt >= max_attempts or not is_retryable(exc):
+        limiter.record("failures")
+        return None
+    delay = retry_after_seconds(exc)
+    if delay is None:
+        delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+    limiter.record("retries")
+    return delay
+
+
+def call_with_retry(provider: str, fn: Callable, max_attempts: int = None, base_delay: float = 1.0,
+                    max_delay: float = 30.0, on_retry: Callable = None, on_wait: Callable = None):
+    """
+    Call fn() within the provider's rate and concurrency limits, retrying retryable errors.
+    Backoff is exponential with full jitter, or the server's Retry-After when given.
+    on_retry(attempt, delay, exc) is called before each retry and on_wait(seconds) with the time each
+    attempt spent queued for a slot. The last error is re-raised.
+    """
+    limiter = get_limiter(provider)
+    if max_attempts is None:
+        max_attempts = int(os.getenv("LLM_MAX_ATTEMPTS", "5"))
+    attempt = 1
+    while True:
+        try:
+            with limiter.slot() as waited:
+                if on_wait:
+                    on_wait(waited)
+                result = fn()
+            limiter.bucket.succeeded()
+            return result
+        except Exception as e:
+            delay = _retry_delay(limiter, e, attempt, max_attempts, base_delay, max_delay)
+            if delay is None:
+                raise
+            if on_retry:
+                on_retry(attempt, delay, e)
+            time.sleep(min(delay, max_delay * 4))
+            attempt += 1
+
+
+async def async_call_with_retry(provider: str, fn: Callable[[], Awaitable], max_attempts: int = None,
+                                base_delay: float = 1.0, max_delay: float = 30.0, on_retry: Callable = None,
+                                on_wait: Callable = None):
+    """call_with_retry() for coroutines: fn() returns an awaitable, and waits don't block the loop."""
+    limiter = get_limiter(provider)
+    if max_attempts is None:
+        max_attempts = int(os.getenv("LLM_MAX_ATTEMPTS", "5"))
+    attempt = 1
+    while True:
+        try:
+            async with limiter.async_slot() as waited:
+                if on_wait:
+                    on_wait(waited)
+                result = await fn()
+            limiter.bucket.succeeded()
+            return result
+        except Exception as e:
+            delay = _retry_delay(limiter, e, attempt, max_attempts, base_delay, max_delay)
+            if delay is None:
+                raise
+            if on_retry:
+                on_retry(attempt, delay, e)
+            await asyncio.sleep(min(delay, max_delay * 4))
+            attempt += 1
@@ -0,0 +1,74 @@
+"""Route streamed LLM tokens from CrewAI to per-step callbacks.
+CrewAI publishes each streamed chunk on its event bus. A single listener is installed once
+per process, and it forwards chunks to whichever callback is registered for the emitting agent.
+Routing falls back to the calling thread on CrewAI versions whose events don't carry the agent.
+"""
+import threading
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_sinks = {}
+_local = threading.local()
+_installed = False
+
+
+def _agent_keys(agent):
+    keys = [("obj", id(agent))]
+    agent_id = getattr(agent, "id", None)
+    if agent_id is not None:
+        keys.append(("id", str(agent_id)))
+    return keys
+
+
+def _on_stream_chunk(source, event):
+    chunk = getattr(event, "chunk", None)
+    if not chunk:
+        return
+    sink = None
+    agent = getattr(event, "from_agent", None)
+    with _lock:
+        if agent is not None:
+            sink = _sinks.get(("obj", id(agent)))
+        if sink is None and getattr(event, "agent_id", None):
+            sink = _sinks.get(("id", str(event.agent_id)))
+    if sink is None:
+        sink = getattr(_local, "sink", None)
+    if sink is not None:
+        sink(chunk)
+
+
+def install_stream_listener() -> bool:
+    """Subscribe to CrewAI's stream chunk events. Returns False if this CrewAI can't stream."""
+    global _installed
+    with _lock:
+        if _installed:
+            return True
+        try:
+            from crewai.events import crewai_event_bus, LLMStreamChunkEvent
+        except ImportError:
+            try:
+                from crewai.utilities.events import crewai_event_bus, LLMStreamChunkEvent
+            except ImportError:
+                return False
+        crewai_event_bus.on(LLMStreamChunkEvent)(_on_stream_chunk)
+        _installed = True
+        return True
+
+
+@contextmanager
+def stream_tokens(agent, on_token):
+    """Forward tokens streamed by `agent` (or on this thread) to on_token while the block runs."""
+    install_stream_listener()
+    keys = _agent_keys(agent)
+    with _lock:
+        for key in keys:
+            _sinks[key] = on_token
+    previous = getattr(_local, "sink", None)
+    _local.sink = on_token
+    try:
+        yield
+    finally:
+        _local.sink = previous
+        with _lock:
+            for key in keys:
+                _sinks.pop(key, None)
@@ -1,125 +1,243 @@
+import time
 import streamlit as st
-from crew_orchestrator import plan_trip_with_crew_stream
+from plan_jobs import get_job_manager, stream_job_events
+from trip_prefetch import TripPrefetcher
 from utils.export_utils import generate_pdf_from_text
+from utils.instrumentation import summarize_metrics
 
 st.set_page_config(page_title="Trip Planner AI", page_icon="🌍")
 st.title("🌍 Trip Planner AI")
 st.write("Fill in your trip details to get a personalized plan powered by AI agents!")
 
-with st.form("trip_form"):
+# Plain widgets rather than st.form: each committed field reruns the script, which lets
+# destination research and airport lookups start before the plan is requested
+with st.container(border=True):
     origin = st.text_input("Where are you starting your trip from? (City/Country)")
     destination = st.text_input("Where do you want to go? (City/Country or type, e.g. 'beach in Europe')")
     days = st.number_input("How many days do you want your trip to be?", min_value=1, max_value=60, value=5)
     budget = st.text_input("What is your total budget for the trip (in your currency)?")
     preferences = st.text_input("Any special preferences? (e.g. family-friendly, adventure, sightseeing, food, etc.)")
     people = st.number_input("How many people are traveling?", min_value=1, max_value=20, value=2, step=1)
-    submitted = st.form_submit_button("Get My Trip Plan!")
+    submitted = st.button("Get My Trip Plan!")
+
+if "prefetcher" not in st.session_state:
+    st.session_state["prefetcher"] = TripPrefetcher()
+prefetcher = st.session_state["prefetcher"]
+prefetcher.update({
+    "origin": origin,
+    "destination": destination,
+    "days": days,
+    "budget": budget,
+    "preferences": preferences,
+    "people": people,
+})
 
 if submitted:
+    # A new submission replaces the previous plan
+    st.session_state.pop("trip_plan", None)
+    st.session_state.pop("pdf_requested", None)
     if not origin or not destination:
         st.error("⚠️ Please fill in at least the departure and destination fields!")
     else:
-        # Create progress placeholders
-        st.markdown("## 🤖 AI Agents Working on Your Trip Plan")
-        
-        progress_container = st.container()
-        
-        with progress_container:
-            step1 = st.empty()
-            step2 = st.empty()
-            step3 = st.empty()
-            step4 = st.empty()
-            final_status = st.empty()
-        
-        # Display initial waiting states
-        step1.markdown("**📍 Destination Research Specialist**\n\nStatus: ⏳ Waiting")
-        step2.markdown("**✈️ Flight Booking Specialist**\n\nStatus: ⏳ Waiting")
-        step3.markdown("**📋 Travel Itinerary Planner**\n\nStatus: ⏳ Waiting")
-        step4.markdown("**💰 Travel Budget Analyst**\n\nStatus: ⏳ Waiting")
-
-        result = None
-        try:
-            # Stream real-time progress from the crew
-            for event in plan_trip_with_crew_stream(
-                origin=origin,
-                destination=destination,
-                days=days,
-                budget=budget,
-                preferences=preferences,
-                people=people
-            ):
-                etype = event.get("type")
-                estep = event.get("step")
-                if etype == "start":
-                    if estep == 1:
-                        step1.markdown("**📍 Destination Research Specialist**\n\nStatus: 🔄 Working...")
-                    elif estep == 2:
-                        step2.markdown("**✈️ Flight Booking Specialist**\n\nStatus: 🔄 Working...")
-                    elif estep == 3:
-                        step3.markdown("**📋 Travel Itinerary Planner**\n\nStatus: 🔄 Working...")
-                    elif estep == 4:
-                        step4.markdown("**💰 Travel Budget Analyst**\n\nStatus: 🔄 Working...")
-                elif etype == "done":
-                    if estep == 1:
-                        step1.markdown("**📍 Destination Research Specialist**\n\nStatus: ✅ Completed")
-                    elif estep == 2:
-                        step2.markdown("**✈️ Flight Booking Specialist**\n\nStatus: ✅ Completed")
-                    elif estep == 3:
-                        step3.markdown("**📋 Travel Itinerary Planner**\n\nStatus: ✅ Completed")
-                    elif estep == 4:
-                        step4.markdown("**💰 Travel Budget Analyst**\n\nStatus: ✅ Completed")
-                elif etype == "error":
-                    agent = event.get("agent", "Agent")
-                    msg = event.get("result", "Unknown error")
-                    st.error(f"❌ {agent} failed: {msg}")
-                    break
-                elif etype == "final":
-                    result = event.get("result")
-        except Exception as e:
-            st.error(f"❌ Error: {str(e)}")
-            result = None
-
-        if result is not None:
-            # Final status
-            final_status.success("🎉 **Crew Execution Completed!** Your trip plan is ready.")
-            
-            # Display result
-            st.markdown("---")
-            st.markdown("## 📝 Your Trip Plan:")
-            st.markdown(
-                f"**Trip Summary**  "+
-                f"From: {origin} → To: {destination}  |  Days: {days}  |  People: {people}  |  Budget: {budget}")
-            
-            # Clean the result text to remove strikethrough formatting
-            cleaned_result = result.replace("~~", "").replace("<del>", "").replace("</del>", "").replace("<s>", "").replace("</s>", "")
-            
-            try:
-                st.markdown(cleaned_result, unsafe_allow_html=True)
-            except Exception:
-                st.write(cleaned_result)
-
-            # PDF Export
-            st.divider()
-            st.subheader("Export Your Plan")
-            
-            with st.spinner("Rendering PDF..."):
-                pdf_bytes = generate_pdf_from_text(result, title="Trip Plan")
-            
-            # Generate dynamic filename: origin_to_destination_DDMMYYYY.pdf
-            from datetime import datetime
-            today = datetime.now().strftime("%d%m%Y")
-            # Clean origin and destination for filename (remove spaces and special chars)
-            clean_origin = "".join(c for c in origin if c.isalnum() or c in (' ', '-')).strip().replace(' ', '_')
-            clean_dest = "".join(c for c in destination if c.isalnum() or c in (' ', '-')).strip().replace(' ', '_')
-            filename = f"{clean_origin}_to_{clean_dest}_{today}.pdf"
-            
-            st.download_button(
-                label="📄 Download PDF",
-                data=pdf_bytes,
-                file_name=filename,
-                mime="application/pdf",
-                key="pdf_download"
-            )
+        # The plan runs on a background worker; this page only follows its event log
+        job_id = get_job_manager().submit(
+            {
+                "origin": origin,
+                "destination": destination,
+                "days": days,
+                "budget": budget,
+                "preferences": preferences,
+                "people": people,
+            },
+            prefetch=prefetcher,
+        )
+        st.session_state["plan_job"] = job_id
+        # Kept in the URL so a refreshed page (a new session) picks the job back up
+        st.query_params["job"] = job_id
+
+if "plan_job" not in st.session_state and st.query_params.get("job") and "trip_plan" not in st.session_state:
+    st.session_state["plan_job"] = st.query_params["job"]
+
+job_id = st.session_state.get("plan_job")
+job = get_job_manager().store.get(job_id) if job_id else None
+if job_id and job is None:
+    # Unknown or purged job id (e.g. an old link)
+    st.session_state.pop("plan_job", None)
+    st.query_params.pop("job", None)
+elif job:
+    trip = job["params"]
+
+    # Create progress placeholders
+    st.markdown("## 🤖 AI Agents Working on Your Trip Plan")
+    
+    progress_container = st.container()
+    
+    with progress_container:
+        step1 = st.empty()
+        step2 = st.empty()
+        step3 = st.empty()
+        step4 = st.empty()
+        step5 = st.empty()
+        final_status = st.empty()
+
+    step_views = {
+        1: (step1, "**📍 Destination Research Specialist** · Overview"),
+        2: (step2, "**🎯 Destination Research Specialist** · Activities"),
+        3: (step3, "**✈️ Flight Booking Specialist**"),
+        4: (step4, "**📋 Travel Itinerary Planner**"),
+        5: (step5, "**💰 Travel Budget Analyst**"),
+    }
+    # Partial output per step, rendered as tokens stream in
+    partial_text = {estep: "" for estep in step_views}
+    last_render = {estep: 0.0 for estep in step_views}
+
+    # Display initial waiting states
+    for placeholder, header in step_views.values():
+        placeholder.markdown(f"{header}\n\nStatus: ⏳ Waiting")
+
+    result = None
+    failed = False
+    step_metrics = []
+    try:
+        # Replay the job's events from the start, then follow new ones as the worker writes them
+        for _, event in stream_job_events(get_job_manager().store, job_id):
+            etype = event.get("type")
+            estep = event.get("step")
+            if etype == "restart":
+                # The job was picked up again after its worker stopped
+                partial_text = {estep: "" for estep in step_views}
+                step_metrics = []
+                for placeholder, header in step_views.values():
+                    placeholder.markdown(f"{header}\n\nStatus: ⏳ Waiting")
+            elif etype == "start" and estep in step_views:
+                placeholder, header = step_views[estep]
+                placeholder.markdown(f"{header}\n\nStatus: 🔄 Working...")
+            elif etype == "reset" and estep in step_views:
+                # The step's LLM call is being retried and will stream its answer again
+                partial_text[estep] = ""
+                placeholder, header = step_views[estep]
+                placeholder.markdown(f"{header}\n\nStatus: 🔄 Working...")
+            elif etype == "delta" and estep in step_views:
+                partial_text[estep] += event.get("result") or ""
+                # Throttle redraws; a rerender per token would flood the websocket
+                now = time.monotonic()
+                if now - last_render[estep] >= 0.15:
+                    last_render[estep] = now
+                    placeholder, header = step_views[estep]
+                    placeholder.markdown(f"{header}\n\nStatus: 🔄 Working...\n\n{partial_text[estep]}▌")
+            elif etype == "done" and estep in step_views:
+                placeholder, header = step_views[estep]
+                placeholder.markdown(f"{header}\n\nStatus: ✅ Completed")
+                if event.get("metrics"):
+                    step_metrics.append(event["metrics"])
+            elif etype == "error":
+                # A failed step's retries and tokens still count
+                if event.get("metrics"):
+                    step_metrics.append(event["metrics"])
+                agent = event.get("agent", "Agent")
+                msg = event.get("result", "Unknown error")
+                st.error(f"❌ {agent} failed: {msg}")
+                failed = True
+            elif etype == "final":
+                result = event.get("result")
+    except Exception as e:
+        st.error(f"❌ Error: {str(e)}")
+        failed = True
+
+    if result is not None or failed:
+        # The job is finished; later reruns show the stored plan instead of replaying it
+        st.session_state.pop("plan_job", None)
+        st.query_params.pop("job", None)
+        # Per-step timings for this plan, kept for the session summary below
+        if step_metrics:
+            st.session_state.setdefault("metrics_history", []).append(step_metrics)
+
+    if result is not None:
+        # Final status
+        final_status.success("🎉 **Crew Execution Completed!** Your trip plan is ready.")
+        # Keep the plan across reruns (e.g. the PDF buttons below)
+        st.session_state["trip_plan"] = {
+            "result": result,
+            "origin": trip["origin"],
+            "destination": trip["destination"],
+            "days": trip["days"],
+            "people": trip["people"],
+            "budget": trip["budget"],
+        }
+
+plan = st.session_state.get("trip_plan")
+if plan:
+    result = plan["result"]
+
+    # Display result
+    st.markdown("---")
+    st.markdown("## 📝 Your Trip Plan:")
+    st.markdown(
+        f"**Trip Summary**  "+
+        f"From: {plan['origin']} → To: {plan['destination']}  |  Days: {plan['days']}  |  People: {plan['people']}  |  Budget: {plan['budget']}")
+
+    # Clean the result text to remove strikethrough formatting
+    cleaned_result = result.replace("~~", "").replace("<del>", "").replace("</del>", "").replace("<s>", "").replace("</s>", "")
+
+    try:
+        st.markdown(cleaned_result, unsafe_allow_html=True)
+    except Exception:
+        st.write(cleaned_result)
+
+    # PDF Export
+    st.divider()
+    st.subheader("Export Your Plan")
+
+    # Render the PDF only once it's asked for; renders are cached by content
+    if st.button("📄 Prepare PDF", key="pdf_prepare"):
+        st.session_state["pdf_requested"] = True
+
+    if st.session_state.get("pdf_requested"):
+        with st.spinner("Rendering PDF..."):
+            pdf_bytes = generate_pdf_from_text(result, title="Trip Plan")
+
+        # Generate dynamic filename: origin_to_destination_DDMMYYYY.pdf
+        from datetime import datetime
+        today = datetime.now().strftime("%d%m%Y")
+        # Clean origin and destination for filename (remove spaces and special chars)
+        clean_origin = "".join(c for c in plan["origin"] if c.isalnum() or c in (' ', '-')).strip().replace(' ', '_')
+        clean_dest = "".join(c for c in plan["destination"] if c.isalnum() or c in (' ', '-')).strip().replace(' ', '_')
+        filename = f"{clean_origin}_to_{clean_dest}_{today}.pdf"
+
+        st.download_button(
+            label="📄 Download PDF",
+            data=pdf_bytes,
+            file_name=filename,
+            mime="application/pdf",
+            key="pdf_download"
+        )
+
+history = st.session_state.get("metrics_history")
+if history:
+    with st.expander("⏱️ Performance"):
+        st.caption("Last plan")
+        st.table([
+            {
+                "Agent": m.get("agent"),
+                "Wall (s)": m.get("wall_time_s"),
+                "Queued (s)": m.get("queue_time_s"),
+                "Prompt tokens": m.get("prompt_tokens"),
+                "Completion tokens": m.get("completion_tokens"),
+                "Retries": m.get("retries"),
+                "Cached": m.get("cache_hit"),
+                "Prefetched": m.get("prefetched"),
+                "Reused": m.get("reused"),
+                "Failed": m.get("failed", False),
+            }
+            for m in history[-1]
+        ])
+        totals = summarize_metrics(m for plan_metrics in history for m in plan_metrics)
+        st.caption(
+            f"This session: {len(history)} plan(s), {totals['steps']} steps, "
+            f"{totals['prompt_tokens'] + totals['completion_tokens']} tokens, "
+            f"{totals['cache_hits']} cache hits, {totals['retries']} retries, {totals['failures']} failed, "
+            f"{totals['wall_time_s']}s agent time"
+        )
 
 # Footer
 from datetime import datetime